@@ -0,0 +1,182 @@
+"""
+按计算量的准入控制：限制单机同时处理的像素总量，并优先执行小任务
+
+- 每个请求的代价以“等效百万像素”估算：图像尺寸（只读文件头）× 处理方式的权重
+- 所有 worker 进程共用一个账本文件，正在执行的请求代价之和不超过预算
+- 排队的请求按代价从小到大（相同代价按到达顺序）获得执行机会，交互式的小图不会被大图阻塞
+- 等待超过时限仍未获准的请求抛出 Overloaded，由调用方返回 503 和 Retry-After
+
+账本 admission.json 记录每个请求的代价、所属进程和是否在执行，每次读写都持有它的文件锁
+（见 filelocks）；进程崩溃遗留的条目在下一次访问时按进程号清除。
+"""
+
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from filelocks import locked_json
+
+# 每百万像素的相对计算量（以彩色“调整”模式为 1.0，包含PNG编码）
+PROCESSING_WEIGHTS = {
+    "color": {"original": 0.55, "adjusted": 1.0, "enhanced": 1.2},
+    "grayscale": {
+        "minimal": 0.25,
+        "standard": 0.25,
+        "more": 0.3,
+        "most": 0.35,
+        "extreme": 0.35,
+        "silhouette": 0.15,
+    },
+}
+UPLOAD_WEIGHT = 0.3  # 解码、保存原始像素和生成瓦片金字塔
+EXPAND_WEIGHT = 0.5  # 添加白边并重新编码上传文件
+PREVIEW_WEIGHT = 0.1  # 原尺寸透视校正，缩略图本身可忽略
+ROTATE_WEIGHT = 0.65  # 解码、旋转并编码PNG（按彩色结果估算）
+ALPHA_FACTOR = 1.2  # 带Alpha通道时的额外开销
+
+
+class Overloaded(Exception):
+    """在等待时限内没有足够的像素预算"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def estimate_cost(
+    width,
+    height,
+    operation,
+    color_mode=None,
+    processing_option=None,
+    has_alpha=False,
+    expand=False,
+):
+    """
+    估算请求的代价（等效百万像素）
+
+    Args:
+        width, height: 源图像尺寸，未知时传 None（代价为 0，直接放行）
+        operation: "upload"、"process"、"preview" 或 "rotate"
+        color_mode, processing_option: operation 为 "process" 时的处理方式
+        has_alpha: 是否带Alpha通道
+        expand: 上传时是否添加白边
+    """
+    if not width or not height:
+        return 0.0
+
+    megapixels = width * height / 1_000_000
+    if operation == "upload":
+        weight = UPLOAD_WEIGHT
+        if expand:
+            # 白边使宽高各增加40%
+            weight = EXPAND_WEIGHT + UPLOAD_WEIGHT * 1.4 * 1.4
+    elif operation == "preview":
+        weight = PREVIEW_WEIGHT
+    elif operation == "rotate":
+        weight = ROTATE_WEIGHT
+    else:
+        weight = PROCESSING_WEIGHTS.get(color_mode, PROCESSING_WEIGHTS["color"]).get(
+            processing_option, 1.0
+        )
+
+    if has_alpha:
+        weight *= ALPHA_FACTOR
+    return megapixels * weight
+
+
+class AdmissionControl:
+    """
+    单机像素预算：请求排队直到正在执行的代价之和允许它开始
+
+    Args:
+        folder: 存放账本文件的目录（所有 worker 共用）
+        budget: 同时执行的请求代价上限（等效百万像素），0 表示不限制
+        wait: 排队的最长时间（秒），超时抛出 Overloaded
+        retry_after: 建议客户端重试前等待的秒数
+        poll_interval: 排队时检查账本的间隔（秒）
+    """
+
+    def __init__(self, folder, budget, wait=10, retry_after=5, poll_interval=0.05):
+        self.folder = folder
+        self.budget = budget
+        self.wait = wait
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+
+    @contextmanager
+    def admit(self, cost):
+        """排队直到预算允许再执行，退出时释放占用的预算"""
+        if self.budget <= 0:
+            yield
+            return
+
+        ticket = uuid.uuid4().hex
+        with self._ledger() as entries:
+            entries[ticket] = {
+                "cost": cost,
+                "pid": os.getpid(),
+                "since": time.time(),
+                "running": False,
+            }
+        try:
+            self._wait_turn(ticket)
+            yield
+        finally:
+            with self._ledger() as entries:
+                entries.pop(ticket, None)
+
+    def _wait_turn(self, ticket):
+        deadline = time.monotonic() + self.wait
+        while True:
+            with self._ledger() as entries:
+                if self._may_start(entries, ticket):
+                    entries[ticket]["running"] = True
+                    return
+                expired = time.monotonic() >= deadline
+                if expired:
+                    entries.pop(ticket, None)
+            if expired:
+                raise Overloaded(self.retry_after)
+            time.sleep(self.poll_interval)
+
+    def _may_start(self, entries, ticket):
+        """
+        最短作业优先：比本请求更小（或同样大但更早）的排队请求优先占用预算；
+        没有请求在执行时，队首请求即使超出预算也可以执行，避免大图永远无法处理
+        """
+        me = entries[ticket]
+        running = sum(e["cost"] for e in entries.values() if e["running"])
+        ahead = [
+            e
+            for e in entries.values()
+            if not e["running"] and (e["cost"], e["since"]) < (me["cost"], me["since"])
+        ]
+        if not ahead and running == 0:
+            return True
+        return running + sum(e["cost"] for e in ahead) + me["cost"] <= self.budget
+
+    @contextmanager
+    def _ledger(self):
+        """
+        在文件锁内读取账本，退出时写回（清理已退出进程遗留的条目）
+
+        账本文件本身作为锁文件，每次访问都会更新，不会被 flask cleanup 当作过期文件删除
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with locked_json(os.path.join(self.folder, "admission.json")) as entries:
+            for ticket, entry in list(entries.items()):
+                if not _process_alive(entry["pid"]):
+                    del entries[ticket]
+            yield entries
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
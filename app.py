@@ -1,19 +1,33 @@
 import os
-import cv2
-import numpy as np
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, send_file, url_for
+from flask import (
+    Flask,
+    render_template,
+    request,
+    jsonify,
+    send_file,
+    send_from_directory,
+    url_for,
+)
 from flask_bootstrap import Bootstrap5
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageEnhance
 import base64
+import json
+import math
 from dotenv import load_dotenv
 import click
+import shutil
 import uuid
-from pillow_heif import register_heif_opener
+from singleflight import SingleFlight, Superseded
+from admission import AdmissionControl, Overloaded, estimate_cost
+from resumable import (
+    InvalidChunk,
+    SessionNotFound,
+    UploadSessions,
+    parse_content_range,
+)
 
-# Register HEIF opener to enable HEIC/HEIF support in PIL
-register_heif_opener()
+# 图像处理栈（cv2/numpy/PIL/pillow_heif）在 imaging.py 中，按需延迟导入
 
 load_dotenv()
 app = Flask(__name__)
@@ -31,12 +45,49 @@ app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", "167
 app.config["BOOTSTRAP_SERVE_LOCAL"] = True
 bootstrap = Bootstrap5(app)
 
-# Ensure upload and processed directories exist
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-os.makedirs(app.config["PROCESSED_FOLDER"], exist_ok=True)
-
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "bmp", "heic", "heif"}
 
+# 上传时解码一次后保存的原始像素文件后缀（与上传文件同目录）
+PIXEL_STORE_SUFFIX = ".npy"
+
+# 上传时只读文件头得到的图像信息（尺寸、通道、位深、帧数）文件后缀
+METADATA_SUFFIX = ".meta.json"
+# 允许解码的最大像素数（添加白边后），0 表示不限制
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", "100000000"))
+# 添加白边后宽高各增加40%
+EXPAND_FACTOR = 1.4
+
+# 区域选择用的瓦片金字塔目录后缀、预览图长边和瓦片尺寸（像素）
+PYRAMID_SUFFIX = ".pyramid"
+OVERVIEW_SIZE = int(os.environ.get("OVERVIEW_SIZE", "1024"))
+TILE_SIZE = 256
+
+# 选项预览缩略图的最长边（像素）
+PREVIEW_THUMBNAIL_SIZE = int(os.environ.get("PREVIEW_THUMBNAIL_SIZE", "320"))
+
+# 相同处理请求的合并：共享目录及结果复用时间（秒）
+INFLIGHT_FOLDER = os.path.join(app.config["PROCESSED_FOLDER"], ".inflight")
+single_flight = SingleFlight(
+    INFLIGHT_FOLDER, window=int(os.environ.get("COALESCE_WINDOW", "30"))
+)
+
+# 按计算量的准入控制：单机同时处理的等效百万像素上限（0 表示不限制）、
+# 排队的最长时间及建议客户端重试的间隔（秒）
+admission_control = AdmissionControl(
+    INFLIGHT_FOLDER,
+    budget=float(os.environ.get("PIXEL_BUDGET", str(25 * (os.cpu_count() or 1)))),
+    wait=float(os.environ.get("ADMISSION_WAIT", "10")),
+    retry_after=int(os.environ.get("ADMISSION_RETRY_AFTER", "5")),
+)
+
+# 可续传的分块上传：会话目录（与上传文件同一文件系统）、建议的分块大小（字节）
+# 及未完成会话的有效期（秒）
+upload_sessions = UploadSessions(
+    os.path.join(app.config["UPLOAD_FOLDER"], ".sessions"),
+    chunk_size=int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024))),
+    ttl=int(os.environ.get("UPLOAD_SESSION_TTL", str(24 * 3600))),
+)
+
 
 @app.context_processor
 def inject_url_helpers():
@@ -66,7 +117,9 @@ def inject_upload_config():
     # 降低5%余量并转换为MB
     max_size_mb = round((max_size_bytes * 0.95) / (1024 * 1024), 1)
     return dict(
-        max_upload_size_mb=max_size_mb, max_upload_size_bytes=int(max_size_bytes * 0.95)
+        max_upload_size_mb=max_size_mb,
+        max_upload_size_bytes=int(max_size_bytes * 0.95),
+        upload_chunk_size=upload_sessions.chunk_size,
     )
 
 
@@ -74,44 +127,332 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def expand_image_borders(filepath):
-    """为图片添加20%的白边"""
+def ensure_storage_folders():
+    """确保上传和处理结果目录存在（在首次写入前调用，而不是在导入时）"""
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    os.makedirs(app.config["PROCESSED_FOLDER"], exist_ok=True)
+
+
+def pixel_store_path(filepath):
+    """上传文件对应的原始像素文件路径"""
+    return filepath + PIXEL_STORE_SUFFIX
+
+
+def pyramid_path(filepath):
+    """上传文件对应的瓦片金字塔目录"""
+    return filepath + PYRAMID_SUFFIX
+
+
+def metadata_path(filepath):
+    """上传文件对应的图像信息文件路径"""
+    return filepath + METADATA_SUFFIX
+
+
+def upload_artifact_source(filepath):
+    """如果 filepath 是上传文件的派生文件（原始像素/金字塔/图像信息），返回对应的上传文件路径"""
+    for suffix in (PIXEL_STORE_SUFFIX, PYRAMID_SUFFIX, METADATA_SUFFIX):
+        if filepath.endswith(suffix):
+            return filepath[: -len(suffix)]
+    return None
+
+
+def remove_upload_artifacts(filepath):
+    """删除上传文件的派生文件，返回释放的字节数"""
+    freed = 0
+    for path in (pixel_store_path(filepath), metadata_path(filepath)):
+        if os.path.exists(path):
+            freed += os.path.getsize(path)
+            os.remove(path)
+
+    tiles_dir = pyramid_path(filepath)
+    if os.path.isdir(tiles_dir):
+        for root, _, names in os.walk(tiles_dir):
+            freed += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        shutil.rmtree(tiles_dir)
+    return freed
+
+
+def store_upload_pixels(filepath, image):
+    """将上传图像解码后的像素写入原始像素文件"""
+    import imaging
+
+    if image is None:
+        return
     try:
-        # 读取图片
-        image = cv2.imread(filepath)
-        if image is None:
-            return filepath
+        imaging.save_pixels(pixel_store_path(filepath), image)
+    except Exception as e:
+        print(f"保存原始像素文件时出错: {e}")
 
-        height, width = image.shape[:2]
 
-        # 计算边框大小（原图尺寸的20%）
-        border_x = int(width * 0.2)
-        border_y = int(height * 0.2)
+def build_upload_pyramid(filepath, image, alpha_image=None):
+    """为上传图像生成瓦片金字塔，失败时返回 None"""
+    import imaging
 
-        # 添加白边
-        expanded_image = cv2.copyMakeBorder(
+    if image is None:
+        return None
+    try:
+        return imaging.build_pyramid(
             image,
-            border_y,
-            border_y,
-            border_x,
-            border_x,  # top, bottom, left, right
-            cv2.BORDER_CONSTANT,
-            value=[255, 255, 255],  # 白色边框
+            pyramid_path(filepath),
+            overview_size=OVERVIEW_SIZE,
+            tile_size=TILE_SIZE,
+            alpha=alpha_image,
         )
+    except Exception as e:
+        print(f"生成瓦片金字塔时出错: {e}")
+        return None
 
-        # 保存扩展后的图片，使用新的文件名
-        base_name, ext = os.path.splitext(filepath)
-        expanded_filepath = f"{base_name}_expanded{ext}"
-        cv2.imwrite(expanded_filepath, expanded_image)
 
-        # 删除原文件
-        os.remove(filepath)
+def write_upload_metadata(filepath, metadata):
+    """保存上传图像的信息，后续阶段无需读取文件即可估算计算量"""
+    with open(metadata_path(filepath), "w", encoding="utf-8") as metadata_file:
+        json.dump(metadata, metadata_file)
 
-        return expanded_filepath
 
-    except Exception as e:
-        print(f"扩展图片边框时出错: {e}")
-        return filepath
+def read_upload_metadata(filename):
+    """读取上传时记录的图像信息，不存在时返回 None"""
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    try:
+        with open(metadata_path(filepath), encoding="utf-8") as metadata_file:
+            return json.load(metadata_file)
+    except (OSError, ValueError):
+        return None
+
+
+def upload_size(filename):
+    """
+    获取上传图像的尺寸而不解码：优先使用上传时记录的图像信息，其次读取文件头，
+    无法识别时返回 (None, None)
+    """
+    import imaging
+
+    metadata = read_upload_metadata(filename)
+    if metadata:
+        return metadata["width"], metadata["height"]
+
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    for path in (pixel_store_path(filepath), filepath):
+        if os.path.exists(path):
+            size = imaging.probe_size(path)
+            if size is not None:
+                return size
+    return None, None
+
+
+def overloaded_response(error):
+    """像素预算不足时的 503 响应"""
+    return (
+        jsonify(
+            {
+                "error": f"服务器繁忙，请 {error.retry_after} 秒后重试",
+                "overloaded": True,
+                "retry_after": error.retry_after,
+            }
+        ),
+        503,
+        {"Retry-After": str(error.retry_after)},
+    )
+
+
+def load_upload_pixels(filename, grayscale=False):
+    """
+    读取上传图像的像素：优先内存映射原始像素文件，不存在时解码原文件
+
+    Returns:
+        图像数组（可能是只读的内存映射），无法读取时返回 None
+    """
+    import imaging
+
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    store_path = pixel_store_path(filepath)
+    if os.path.exists(store_path):
+        try:
+            return imaging.load_pixels(store_path)
+        except (OSError, ValueError) as e:
+            print(f"读取原始像素文件时出错: {e}")
+
+    if not os.path.exists(filepath):
+        return None
+    if grayscale:
+        return imaging.read_alpha(filepath)
+    return imaging.read_image(filepath)
+
+
+def load_corrected_image(filename, corners, alpha_filename=None):
+    """
+    读取上传的图像（及可选的Alpha通道），并在提供四个角点时进行透视校正
+
+    Returns:
+        (corrected_image, corrected_alpha)，无法读取图像时 corrected_image 为 None
+    """
+    import imaging
+
+    image = load_upload_pixels(filename)
+    if image is None:
+        return None, None
+
+    # Load alpha channel if present
+    alpha_channel = None
+    if alpha_filename:
+        alpha_channel = load_upload_pixels(alpha_filename, grayscale=True)
+
+    # Perspective correction only if corners are provided
+    if corners and len(corners) == 4:
+        if alpha_channel is not None:
+            return imaging.perspective_correction(image, corners, alpha_channel)
+        return imaging.perspective_correction(image, corners), None
+
+    # No corners provided, use the whole image without perspective correction
+    return image, alpha_channel
+
+
+def render_processed_png(
+    filename, corners, alpha_filename, color_mode, processing_option
+):
+    """执行完整处理流程，返回PNG字节；无法读取图像时返回 None"""
+    import imaging
+
+    corrected_image, corrected_alpha = load_corrected_image(
+        filename, corners, alpha_filename
+    )
+    if corrected_image is None:
+        return None
+
+    # Post-processing based on color mode and processing option
+    if color_mode == "grayscale":
+        # 使用统一的黑白图像处理函数
+        processed_image = imaging.process_grayscale_image(
+            corrected_image, processing_option
+        )
+    else:  # color mode
+        # 使用统一的彩色图像处理函数
+        processed_image = imaging.process_color_image(
+            corrected_image, processing_option
+        )
+
+    # Merge alpha channel back if present
+    if corrected_alpha is not None:
+        processed_image = imaging.merge_alpha(processed_image, corrected_alpha)
+
+    return imaging.encode_png(processed_image)
+
+
+def render_coalesced(
+    filename, corners, alpha_filename, color_mode, processing_option, checkpoint=None
+):
+    """
+    合并参数相同的并发处理请求：所有 worker 中只有一个真正计算，其余等待并复用结果
+    """
+    key = single_flight.key(
+        filename=filename,
+        corners=corners or None,
+        alpha_filename=alpha_filename,
+        color_mode=color_mode,
+        processing_option=processing_option,
+    )
+
+    def compute():
+        # 只有真正计算的请求占用像素预算，等待复用结果的请求不占用
+        width, height = upload_size(filename)
+        cost = estimate_cost(
+            width,
+            height,
+            "process",
+            color_mode,
+            processing_option,
+            has_alpha=bool(alpha_filename),
+        )
+        with admission_control.admit(cost):
+            return render_processed_png(
+                filename, corners, alpha_filename, color_mode, processing_option
+            )
+
+    return single_flight.run(key, compute, checkpoint)
+
+
+def ingest_upload(filepath, metadata, expand_image=False):
+    """
+    处理已保存的上传文件：提取Alpha通道、可选添加白边、保存原始像素和图像信息并生成瓦片金字塔
+
+    Args:
+        filepath: 已保存的上传文件
+        metadata: probe_image() 只读文件头得到的图像信息（已通过像素上限检查）
+        expand_image: 是否添加白边
+
+    Returns:
+        /upload 响应中除 success 外的字段
+    """
+    import imaging
+
+    # Check if the image has an alpha channel and save it（文件头显示没有时跳过）
+    has_alpha = False
+    alpha_filename = None
+    if metadata["has_alpha"]:
+        try:
+            candidate_alpha = f"alpha_{os.path.basename(filepath)}"
+            alpha_path = os.path.join(app.config["UPLOAD_FOLDER"], candidate_alpha)
+            if imaging.extract_alpha_channel(filepath, alpha_path):
+                has_alpha = True
+                alpha_filename = candidate_alpha
+        except Exception as e:
+            print(f"Error checking alpha channel: {e}")
+
+    image = None
+    alpha_image = None
+    if expand_image:
+        # Apply image expansion with white borders
+        filepath, image = imaging.expand_image_borders(filepath)
+        # If there's an alpha channel, expand it too
+        if has_alpha and alpha_filename:
+            alpha_path, alpha_image = imaging.expand_image_borders(
+                alpha_path, grayscale=True
+            )
+            alpha_filename = os.path.basename(alpha_path)
+
+    # 只解码一次：保存原始像素（后续处理直接内存映射）并生成瓦片金字塔
+    if image is None:
+        image = imaging.read_image(filepath)
+    if has_alpha and alpha_filename and alpha_image is None:
+        alpha_image = imaging.read_alpha(alpha_path)
+    store_upload_pixels(filepath, image)
+    if alpha_image is not None:
+        store_upload_pixels(alpha_path, alpha_image)
+    pyramid = build_upload_pyramid(filepath, image, alpha_image)
+
+    # 记录最终（添加白边后）的尺寸，供后续阶段估算计算量
+    metadata = dict(metadata, has_alpha=has_alpha, expanded=expand_image)
+    if image is not None:
+        metadata["height"], metadata["width"] = image.shape[:2]
+    write_upload_metadata(filepath, metadata)
+
+    # 前端显示使用屏幕尺寸的预览图；金字塔生成失败时退回原文件
+    if pyramid is not None:
+        display_path = os.path.join(pyramid_path(filepath), "overview.jpg")
+        image_type = "image/jpeg"
+    else:
+        display_path = filepath
+        image_type = "image/png"
+    with open(display_path, "rb") as img_file:
+        img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+
+    return {
+        "filename": os.path.basename(filepath),
+        "image_data": img_base64,
+        "image_type": image_type,
+        "width": image.shape[1] if image is not None else None,
+        "height": image.shape[0] if image is not None else None,
+        "pyramid": pyramid,
+        "metadata": metadata,
+        "has_alpha": has_alpha,
+        "alpha_filename": alpha_filename,
+    }
+
+
+def write_file(path, data):
+    """将字节写入文件"""
+    ensure_storage_folders()
+    with open(path, "wb") as output_file:
+        output_file.write(data)
 
 
 @app.route("/")
@@ -120,6 +461,73 @@ def index():
     return render_template("index.html.jinja2")
 
 
+def new_upload_path(original_filename):
+    """为上传文件生成不会冲突的保存路径（时间戳 + UUID 前缀）"""
+    ensure_storage_folders()
+    filename = secure_filename(original_filename)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 添加UUID后缀避免并发冲突
+    unique_id = str(uuid.uuid4())[:8]
+    filename = f"{timestamp}_{unique_id}_{filename}"
+    return os.path.join(app.config["UPLOAD_FOLDER"], filename)
+
+
+def accept_upload(filepath, expand_image=False):
+    """
+    检查已保存的上传文件并在准入控制下处理，返回 /upload 的响应
+
+    被拒绝（无法识别、像素过多或服务器繁忙）时删除该文件
+    """
+    import imaging
+
+    # 解码前只读文件头，拒绝无法识别或像素数超出上限的图片（小文件也可能解码出巨大图像）
+    try:
+        metadata = imaging.probe_image(filepath)
+    except imaging.DecompressionBombError:
+        os.remove(filepath)
+        return (
+            jsonify(
+                {"error": f"图片尺寸过大，最多支持 {MAX_IMAGE_PIXELS / 1_000_000:g} 百万像素"}
+            ),
+            413,
+        )
+    if metadata is None:
+        os.remove(filepath)
+        return jsonify({"error": "无法识别的图片文件"}), 400
+
+    width, height = metadata["width"], metadata["height"]
+    pixels = width * height
+    if expand_image:
+        pixels *= EXPAND_FACTOR * EXPAND_FACTOR
+    if MAX_IMAGE_PIXELS and pixels > MAX_IMAGE_PIXELS:
+        os.remove(filepath)
+        return (
+            jsonify(
+                {
+                    "error": f"图片尺寸过大（{width}×{height}），"
+                    f"最多支持 {MAX_IMAGE_PIXELS / 1_000_000:g} 百万像素"
+                }
+            ),
+            413,
+        )
+
+    cost = estimate_cost(
+        width,
+        height,
+        "upload",
+        has_alpha=metadata["has_alpha"],
+        expand=expand_image,
+    )
+    try:
+        with admission_control.admit(cost):
+            result = ingest_upload(filepath, metadata, expand_image)
+    except Overloaded as e:
+        os.remove(filepath)
+        return overloaded_response(e)
+
+    return jsonify({"success": True, **result})
+
+
 @app.route("/upload", methods=["POST"])
 def upload_file():
     """处理图片上传"""
@@ -131,62 +539,104 @@ def upload_file():
         return jsonify({"error": "没有选择文件"}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # 添加UUID后缀避免并发冲突
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"{timestamp}_{unique_id}_{filename}"
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+        filepath = new_upload_path(file.filename)
         file.save(filepath)
 
-        # Check if the image has an alpha channel and save it
-        has_alpha = False
-        alpha_filename = None
-        try:
-            # Use PIL to check for alpha channel
-            pil_image = Image.open(filepath)
-            if pil_image.mode in ("RGBA", "LA") or (
-                pil_image.mode == "P" and "transparency" in pil_image.info
-            ):
-                has_alpha = True
-                # Convert to RGBA if needed
-                if pil_image.mode != "RGBA":
-                    pil_image = pil_image.convert("RGBA")
-
-                # Extract and save alpha channel
-                alpha_channel = pil_image.split()[-1]  # Get the alpha channel
-                alpha_filename = f"alpha_{os.path.basename(filepath)}"
-                alpha_path = os.path.join(app.config["UPLOAD_FOLDER"], alpha_filename)
-                alpha_channel.save(alpha_path)
-        except Exception as e:
-            print(f"Error checking alpha channel: {e}")
-
         # Check if expand image option is selected
         expand_image = request.form.get("expandImage") == "on"
+        return accept_upload(filepath, expand_image)
 
-        if expand_image:
-            # Apply image expansion with white borders
-            filepath = expand_image_borders(filepath)
-            # If there's an alpha channel, expand it too
-            if has_alpha and alpha_filename:
-                alpha_path = os.path.join(app.config["UPLOAD_FOLDER"], alpha_filename)
-                expand_image_borders(alpha_path)
+    return jsonify({"error": "不支持的文件格式"}), 400
 
-        # Convert image to base64 for frontend display
-        with open(filepath, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
 
-        return jsonify(
-            {
-                "success": True,
-                "filename": os.path.basename(filepath),
-                "image_data": img_base64,
-                "has_alpha": has_alpha,
-                "alpha_filename": alpha_filename,
-            }
-        )
+@app.route("/upload/sessions", methods=["POST"])
+def create_upload_session():
+    """创建分块上传会话，返回会话ID和建议的分块大小"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename")
+    size = data.get("size")
 
-    return jsonify({"error": "不支持的文件格式"}), 400
+    if not filename:
+        return jsonify({"error": "没有选择文件"}), 400
+    if not allowed_file(filename):
+        return jsonify({"error": "不支持的文件格式"}), 400
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return jsonify({"error": "无效的文件大小"}), 400
+    if size > app.config["MAX_CONTENT_LENGTH"]:
+        return jsonify({"error": "文件过大"}), 413
+
+    ensure_storage_folders()
+    session = upload_sessions.create(filename, size)
+    return jsonify({"success": True, **session}), 201
+
+
+@app.route("/upload/sessions/<upload_id>", methods=["GET"])
+def upload_session_status(upload_id):
+    """查询分块上传会话已收到的字节范围（续传前调用）"""
+    try:
+        session = upload_sessions.status(upload_id)
+    except SessionNotFound:
+        return jsonify({"error": "上传会话不存在或已过期"}), 404
+    return jsonify({"success": True, **session})
+
+
+@app.route("/upload/sessions/<upload_id>", methods=["PUT"])
+def upload_session_chunk(upload_id):
+    """写入一个分块，请求体为原始字节，Content-Range 指明其在文件中的位置"""
+    try:
+        start, end, total = parse_content_range(request.headers.get("Content-Range"))
+        chunk = request.get_data(cache=False)
+        if len(chunk) != end - start + 1:
+            raise InvalidChunk("分块长度与 Content-Range 不符")
+        session = upload_sessions.write(upload_id, start, chunk, total)
+    except SessionNotFound:
+        return jsonify({"error": "上传会话不存在或已过期"}), 404
+    except InvalidChunk as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"success": True, **session})
+
+
+@app.route("/upload/sessions/<upload_id>/finalize", methods=["POST"])
+def finalize_upload_session(upload_id):
+    """
+    校验完整性和 SHA-256 后按常规上传处理，响应与 /upload 相同
+
+    服务器繁忙（503）时会话保持未完成，客户端稍后重试完成即可，无需重传；
+    其他结果记录在会话中，响应丢失后重复的完成请求得到同一响应
+    """
+    data = request.get_json(silent=True) or {}
+    expected_sha256 = (data.get("sha256") or "").lower()
+    expand_image = bool(data.get("expandImage"))
+
+    try:
+        with upload_sessions.finalize(upload_id) as upload:
+            if upload.result is not None:
+                return jsonify(upload.result["body"]), upload.result["status"]
+
+            if expected_sha256 and expected_sha256 != upload.sha256():
+                error = {"error": "文件校验失败，请重新上传"}
+                upload.record(400, error)
+                return jsonify(error), 400
+
+            # 硬链接到上传目录：处理被拒绝时只删除链接，会话数据仍可重试
+            filepath = new_upload_path(upload.filename)
+            try:
+                os.link(upload.data_path, filepath)
+            except OSError:
+                shutil.copyfile(upload.data_path, filepath)
+
+            response = accept_upload(filepath, expand_image)
+            if isinstance(response, tuple):
+                body, status = response[:2]
+            else:
+                body, status = response, 200
+            if status != 503:
+                upload.record(status, body.get_json())
+            return response
+    except SessionNotFound:
+        return jsonify({"error": "上传会话不存在或已过期"}), 404
+    except InvalidChunk as e:
+        return jsonify({"error": str(e), "incomplete": True}), 409
 
 
 @app.route("/process", methods=["POST"])
@@ -203,50 +653,12 @@ def process_image():
         return jsonify({"error": "缺少文件名参数"}), 400
 
     try:
-        # Load image
-        image_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        image = cv2.imread(image_path)
-        if image is None:
+        png_data = render_coalesced(
+            filename, corners, alpha_filename, color_mode, processing_option
+        )
+        if png_data is None:
             return jsonify({"error": "无法读取图像文件"}), 400
 
-        # Load alpha channel if present
-        alpha_channel = None
-        if alpha_filename:
-            alpha_path = os.path.join(app.config["UPLOAD_FOLDER"], alpha_filename)
-            if os.path.exists(alpha_path):
-                alpha_channel = cv2.imread(alpha_path, cv2.IMREAD_GRAYSCALE)
-
-        # Perspective correction only if corners are provided
-        if corners and len(corners) == 4:
-            if alpha_channel is not None:
-                corrected_image, corrected_alpha = perspective_correction(
-                    image, corners, alpha_channel
-                )
-            else:
-                corrected_image = perspective_correction(image, corners)
-                corrected_alpha = None
-        else:
-            # No corners provided, use the whole image without perspective correction
-            corrected_image = image
-            corrected_alpha = alpha_channel
-
-        # Post-processing based on color mode and processing option
-        if color_mode == "grayscale":
-            # 使用统一的黑白图像处理函数
-            processed_image = process_grayscale_image(
-                corrected_image, processing_option
-            )
-        else:  # color mode
-            # 使用统一的彩色图像处理函数
-            processed_image = process_color_image(corrected_image, processing_option)
-
-        # Merge alpha channel back if present
-        if corrected_alpha is not None:
-            # Convert BGR to BGRA
-            processed_image = cv2.cvtColor(processed_image, cv2.COLOR_BGR2BGRA)
-            # Replace alpha channel
-            processed_image[:, :, 3] = corrected_alpha
-
         # Save processed image
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         # 添加UUID后缀避免并发冲突
@@ -255,11 +667,10 @@ def process_image():
         processed_path = os.path.join(
             app.config["PROCESSED_FOLDER"], processed_filename
         )
-        cv2.imwrite(processed_path, processed_image)
+        write_file(processed_path, png_data)
 
         # Convert to base64 for frontend
-        _, buffer = cv2.imencode(".png", processed_image)
-        img_base64 = base64.b64encode(buffer).decode("utf-8")
+        img_base64 = base64.b64encode(png_data).decode("utf-8")
 
         return jsonify(
             {
@@ -269,6 +680,8 @@ def process_image():
             }
         )
 
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": f"图像处理失败: {str(e)}"}), 500
 
@@ -286,50 +699,25 @@ def reprocess_image():
     if not filename:
         return jsonify({"error": "缺少文件名参数"}), 400
 
-    try:
-        # Load original image
-        image_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        image = cv2.imread(image_path)
-        if image is None:
-            return jsonify({"error": "无法读取图像文件"}), 400
+    # 同一结果文件的新请求会使本请求失效（用户快速切换选项时）
+    target = data.get("processed_filename")
+    token = single_flight.claim(target) if target else None
 
-        # Load alpha channel if present
-        alpha_channel = None
-        if alpha_filename:
-            alpha_path = os.path.join(app.config["UPLOAD_FOLDER"], alpha_filename)
-            if os.path.exists(alpha_path):
-                alpha_channel = cv2.imread(alpha_path, cv2.IMREAD_GRAYSCALE)
-
-        # Perspective correction only if corners are provided
-        if corners and len(corners) == 4:
-            if alpha_channel is not None:
-                corrected_image, corrected_alpha = perspective_correction(
-                    image, corners, alpha_channel
-                )
-            else:
-                corrected_image = perspective_correction(image, corners)
-                corrected_alpha = None
-        else:
-            # No corners provided, use the whole image without perspective correction
-            corrected_image = image
-            corrected_alpha = alpha_channel
-
-        # Post-processing based on color mode and processing option
-        if color_mode == "grayscale":
-            # 使用统一的黑白图像处理函数
-            processed_image = process_grayscale_image(
-                corrected_image, processing_option
-            )
-        else:  # color mode
-            # 使用统一的彩色图像处理函数
-            processed_image = process_color_image(corrected_image, processing_option)
+    def checkpoint():
+        if token:
+            single_flight.check(target, token)
 
-        # Merge alpha channel back if present
-        if corrected_alpha is not None:
-            # Convert BGR to BGRA
-            processed_image = cv2.cvtColor(processed_image, cv2.COLOR_BGR2BGRA)
-            # Replace alpha channel
-            processed_image[:, :, 3] = corrected_alpha
+    try:
+        png_data = render_coalesced(
+            filename,
+            corners,
+            alpha_filename,
+            color_mode,
+            processing_option,
+            checkpoint,
+        )
+        if png_data is None:
+            return jsonify({"error": "无法读取图像文件"}), 400
 
         # Save processed image (overwrite the current processed image)
         if data.get("processed_filename"):
@@ -343,11 +731,16 @@ def reprocess_image():
         processed_path = os.path.join(
             app.config["PROCESSED_FOLDER"], processed_filename
         )
-        cv2.imwrite(processed_path, processed_image)
+        if token:
+            # 检查与写入在同一把锁内，旧请求不会覆盖新请求的结果
+            single_flight.commit(
+                target, token, lambda: write_file(processed_path, png_data)
+            )
+        else:
+            write_file(processed_path, png_data)
 
         # Convert to base64 for frontend
-        _, buffer = cv2.imencode(".png", processed_image)
-        img_base64 = base64.b64encode(buffer).decode("utf-8")
+        img_base64 = base64.b64encode(png_data).decode("utf-8")
 
         return jsonify(
             {
@@ -357,508 +750,186 @@ def reprocess_image():
             }
         )
 
+    except Superseded:
+        return jsonify({"error": "请求已被更新的处理请求取代", "superseded": True}), 409
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": f"重新处理失败: {str(e)}"}), 500
 
 
-@app.route("/rotate", methods=["POST"])
-def rotate_image():
-    """旋转图像"""
+@app.route("/preview_options", methods=["POST"])
+def preview_options():
+    """一次性生成所有处理选项的缩略图，供用户挑选后再按原尺寸处理"""
     data = request.get_json()
     filename = data.get("filename")
-    angle = data.get("angle", 90)  # 90 or -90 degrees
+    corners = data.get("corners")
+    alpha_filename = data.get("alpha_filename")
 
     if not filename:
         return jsonify({"error": "缺少文件名参数"}), 400
 
     try:
-        image_path = os.path.join(app.config["PROCESSED_FOLDER"], filename)
-        image = cv2.imread(image_path)
+        import imaging
 
-        if image is None:
+        try:
+            thumbnail_size = int(data.get("thumbnail_size", PREVIEW_THUMBNAIL_SIZE))
+        except (TypeError, ValueError):
+            return jsonify({"error": "无效的缩略图尺寸"}), 400
+        if thumbnail_size <= 0:
+            return jsonify({"error": "无效的缩略图尺寸"}), 400
+        # 缩略图在准入控制之外生成，不允许超过配置的尺寸
+        thumbnail_size = min(thumbnail_size, PREVIEW_THUMBNAIL_SIZE)
+
+        width, height = upload_size(filename)
+        cost = estimate_cost(width, height, "preview", has_alpha=bool(alpha_filename))
+        with admission_control.admit(cost):
+            corrected_image, corrected_alpha = load_corrected_image(
+                filename, corners, alpha_filename
+            )
+        if corrected_image is None:
             return jsonify({"error": "无法读取图像文件"}), 400
 
-        # Rotate image
-        if angle == 90:
-            rotated = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
-        elif angle == -90:
-            rotated = cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        else:
-            return jsonify({"error": "不支持的旋转角度"}), 400
-
-        # Save rotated image (overwrite)
-        cv2.imwrite(image_path, rotated)
-
-        # Convert to base64 for frontend
-        _, buffer = cv2.imencode(".png", rotated)
-        img_base64 = base64.b64encode(buffer).decode("utf-8")
-
-        return jsonify({"success": True, "image_data": img_base64})
-
-    except Exception as e:
-        return jsonify({"error": f"旋转失败: {str(e)}"}), 500
+        # 只做一次缩放，所有选项都基于同一张缩略图及其共享中间结果计算
+        corrected_image = imaging.resize_to_fit(corrected_image, thumbnail_size)
+        if corrected_alpha is not None:
+            corrected_alpha = imaging.resize_to_fit(corrected_alpha, thumbnail_size)
 
+        intermediates = imaging.ImageIntermediates(corrected_image)
+        variants = {"color": {}, "grayscale": {}}
+        for option in imaging.COLOR_OPTIONS:
+            variants["color"][option] = imaging.process_color_image(
+                corrected_image, option, intermediates
+            )
+        for option in imaging.GRAYSCALE_OPTIONS:
+            variants["grayscale"][option] = imaging.process_grayscale_image(
+                corrected_image, option, intermediates
+            )
 
-@app.route("/download/<filename>")
-def download_file(filename):
-    """下载处理后的图像"""
-    try:
-        file_path = os.path.join(app.config["PROCESSED_FOLDER"], filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
-            return jsonify({"error": "文件不存在"}), 404
+        thumbnails = {}
+        for color_mode, images in variants.items():
+            thumbnails[color_mode] = {}
+            for option, processed_image in images.items():
+                if corrected_alpha is not None:
+                    processed_image = imaging.merge_alpha(
+                        processed_image, corrected_alpha
+                    )
+                thumbnails[color_mode][option] = base64.b64encode(
+                    imaging.encode_png(processed_image)
+                ).decode("utf-8")
+
+        return jsonify({"success": True, "thumbnails": thumbnails})
+
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
-        return jsonify({"error": f"下载失败: {str(e)}"}), 500
+        return jsonify({"error": f"预览生成失败: {str(e)}"}), 500
 
 
-def perspective_correction(image, corners, alpha_channel=None):
+@app.route("/homography", methods=["POST"])
+def homography():
     """
-    透视校正 - 改进版本，提供更自然的纵横比
-
-    Args:
-        image: 输入图像 (BGR格式)
-        corners: 四个角点坐标
-        alpha_channel: 可选的Alpha通道图像（灰度图）
-
-    Returns:
-        corrected: 校正后的图像
-        corrected_alpha: 校正后的Alpha通道（如果提供了alpha_channel）
+    返回四个角点对应的透视变换矩阵和输出尺寸（与处理时的角点排序完全一致），
+    前端据此在本地绘制实时预览，无需调用 /process
     """
-    # Convert corners to numpy array
-    src_points = np.array(corners, dtype=np.float32)
-
-    # 简化的角点排序：按照左上、右上、右下、左下的顺序
-    # 计算Y轴重心来分离上下两组点
-    center_y = np.mean(src_points[:, 1])
-
-    # 按照位置分类
-    top_points = []
-    bottom_points = []
-
-    for point in src_points:
-        if point[1] < center_y:
-            top_points.append(point)
-        else:
-            bottom_points.append(point)
-
-    # 确保每个部分有2个点
-    if len(top_points) != 2 or len(bottom_points) != 2:
-        # 如果分类失败，使用原始顺序
-        ordered_points = src_points
-    else:
-        # 在上方点中，左边的是左上，右边的是右上
-        top_points.sort(key=lambda p: p[0])
-        # 在下方点中，左边的是左下，右边的是右下
-        bottom_points.sort(key=lambda p: p[0])
-
-        # 按照左上、右上、右下、左下的顺序排列
-        ordered_points = np.array(
-            [
-                top_points[0],  # 左上
-                top_points[1],  # 右上
-                bottom_points[1],  # 右下
-                bottom_points[0],  # 左下
-            ],
-            dtype=np.float32,
-        )
-
-    # Calculate the width and height of the corrected image
-    width_top = np.linalg.norm(ordered_points[1] - ordered_points[0])
-    width_bottom = np.linalg.norm(ordered_points[2] - ordered_points[3])
-    width = int((width_top + width_bottom) / 2)
+    data = request.get_json(silent=True) or {}
+    corners = data.get("corners")
 
-    height_left = np.linalg.norm(ordered_points[3] - ordered_points[0])
-    height_right = np.linalg.norm(ordered_points[2] - ordered_points[1])
-    height = int((height_left + height_right) / 2)
+    try:
+        points = [[float(x), float(y)] for x, y in corners]
+    except (TypeError, ValueError):
+        return jsonify({"error": "角点参数无效"}), 400
+    if len(points) != 4:
+        return jsonify({"error": "需要4个角点"}), 400
+    # JSON 解析器接受 NaN/Infinity
+    if not all(math.isfinite(value) for point in points for value in point):
+        return jsonify({"error": "角点参数无效"}), 400
+
+    import imaging
+    import numpy as np
 
-    # Define destination points for a rectangle
-    dst_points = np.array(
-        [[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32
+    try:
+        matrix, (width, height), ordered_points = imaging.perspective_transform(points)
+    except OverflowError:
+        # 坐标过大，边长溢出为无穷大
+        return jsonify({"error": "选择的区域无效"}), 400
+    # 角点重合或共线时没有有效的透视变换
+    if width <= 0 or height <= 0 or not abs(np.linalg.det(matrix)) > 1e-9:
+        return jsonify({"error": "选择的区域无效"}), 400
+
+    return jsonify(
+        {
+            "success": True,
+            "matrix": matrix.tolist(),
+            "width": width,
+            "height": height,
+            "corners": ordered_points.tolist(),
+        }
     )
 
-    # Calculate perspective transformation matrix
-    matrix = cv2.getPerspectiveTransform(ordered_points, dst_points)
-
-    # Apply perspective transformation to the main image
-    corrected = cv2.warpPerspective(image, matrix, (width, height))
-
-    # Apply the same transformation to alpha channel if provided
-    corrected_alpha = None
-    if alpha_channel is not None:
-        corrected_alpha = cv2.warpPerspective(alpha_channel, matrix, (width, height))
-
-    if alpha_channel is not None:
-        return corrected, corrected_alpha
-    return corrected
-
-
-def histogram_equalization(image, clip_limit=3.0, tile_grid_size=(8, 8)):
-    """直方图均衡化处理，支持彩色和灰度图像"""
-    # 判断是彩色还是灰度图像
-    if len(image.shape) == 3:
-        # 彩色图像：在LAB色彩空间中对L通道进行均衡化
-        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-        l_channel, a_channel, b_channel = cv2.split(lab)
-
-        # 对L通道进行CLAHE（限制对比度自适应直方图均衡化）
-        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
-        l_equalized = clahe.apply(l_channel)
-
-        # 重新合并通道
-        lab_equalized = cv2.merge([l_equalized, a_channel, b_channel])
-
-        # 转换回BGR色彩空间
-        result = cv2.cvtColor(lab_equalized, cv2.COLOR_LAB2BGR)
-
-        return result
-    else:
-        # 灰度图像：直接进行CLAHE
-        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
-        return clahe.apply(image)
-
-
-def apply_white_balance(image, mode="color"):
-    """
-    统一的白平衡处理函数
-
-    Args:
-        image: 输入图像 (BGR格式)
-        mode: 处理模式
-            - "color": 彩色图像白平衡，使用加权目标和极值过滤
-            - "grayscale": 灰度图像白平衡，使用简单目标和保守处理
-
-    Returns:
-        处理后的图像 (BGR格式)
-    """
-    # Convert BGR to RGB for PIL processing
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(image_rgb)
-
-    # 分离RGB通道
-    r, g, b = pil_image.split()
-    r_array = np.array(r, dtype=np.float32)
-    g_array = np.array(g, dtype=np.float32)
-    b_array = np.array(b, dtype=np.float32)
-
-    if mode == "color":
-        # 彩色模式：使用robust mean和加权目标
-        def get_robust_mean(channel_array):
-            # 排除极值，只考虑中间范围的像素
-            mask = (channel_array > 30) & (channel_array < 225)
-            if np.sum(mask) > 0:
-                return np.mean(channel_array[mask])
-            else:
-                return np.mean(channel_array)
-
-        r_avg = get_robust_mean(r_array)
-        g_avg = get_robust_mean(g_array)
-        b_avg = get_robust_mean(b_array)
-
-        # 使用 Rec.601 加权平均
-        target = r_avg * 0.299 + g_avg * 0.587 + b_avg * 0.114
-
-        # 因子限制范围
-        factor_range = (0.8, 1.5)
-
-    else:  # mode == "grayscale"
-        # 灰度模式：使用简单mean和保守目标
-        r_avg = np.mean(r_array)
-        g_avg = np.mean(g_array)
-        b_avg = np.mean(b_array)
-
-        # 使用 Rec.601 加权平均
-        target = r_avg * 0.299 + g_avg * 0.587 + b_avg * 0.114
-
-        # 更保守的因子限制，保留更多细节
-        factor_range = (0.85, 1.5)
-
-    # 计算调整因子
-    r_factor = target / r_avg if r_avg > 0 else 1
-    g_factor = target / g_avg if g_avg > 0 else 1
-    b_factor = target / b_avg if b_avg > 0 else 1
-
-    # 应用因子限制
-    r_factor = min(max(r_factor, factor_range[0]), factor_range[1])
-    g_factor = min(max(g_factor, factor_range[0]), factor_range[1])
-    b_factor = min(max(b_factor, factor_range[0]), factor_range[1])
-
-    # 应用白平衡调整
-    r_balanced = np.clip(r_array * r_factor, 0, 255).astype(np.uint8)
-    g_balanced = np.clip(g_array * g_factor, 0, 255).astype(np.uint8)
-    b_balanced = np.clip(b_array * b_factor, 0, 255).astype(np.uint8)
-
-    # 重新构建图像
-    r_img = Image.fromarray(r_balanced)
-    g_img = Image.fromarray(g_balanced)
-    b_img = Image.fromarray(b_balanced)
-    balanced = Image.merge("RGB", (r_img, g_img, b_img))
-
-    # Convert back to BGR for OpenCV
-    final_array = np.array(balanced)
-    return cv2.cvtColor(final_array, cv2.COLOR_RGB2BGR)
 
+@app.route("/rotate", methods=["POST"])
+def rotate_image():
+    """旋转图像"""
+    data = request.get_json()
+    filename = data.get("filename")
+    angle = data.get("angle", 90)  # 90 or -90 degrees
 
-def lab_enhance(image, l_adjust=1.0, ab_adjust=1.0, equalization=False):
-    """
-    LAB色彩空间增强函数，统一处理亮度、色度调整和均衡化
-
-    Args:
-        image: 输入图像 (BGR格式)
-        l_adjust: L通道(亮度)调整系数，1.0表示不调整
-        ab_adjust: A和B通道(色度)调整系数，1.0表示不调整，>1.0增加饱和度
-        equalization: 是否进行直方图均衡化
-
-    Returns:
-        处理后的图像 (BGR格式)
-    """
-    # 如果需要均衡化，先进行直方图均衡化
-    if equalization:
-        image = histogram_equalization(image)
-
-    # 转换为LAB色彩空间
-    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    l_channel, a_channel, b_channel = cv2.split(lab)
-
-    # L通道(亮度)调整
-    if l_adjust != 1.0:
-        l_channel = np.clip(l_channel.astype(np.float32) * l_adjust, 0, 255).astype(
-            np.uint8
-        )
-
-    # A和B通道(色度)调整
-    if ab_adjust != 1.0:
-        # A和B通道的值域是-128到127，需要特殊处理
-        a_channel = np.clip(
-            (a_channel.astype(np.float32) - 128) * ab_adjust + 128, 0, 255
-        ).astype(np.uint8)
-        b_channel = np.clip(
-            (b_channel.astype(np.float32) - 128) * ab_adjust + 128, 0, 255
-        ).astype(np.uint8)
-
-    # 重新合并LAB通道
-    lab_enhanced = cv2.merge([l_channel, a_channel, b_channel])
-
-    # 转换回BGR色彩空间
-    bgr_enhanced = cv2.cvtColor(lab_enhanced, cv2.COLOR_LAB2BGR)
-
-    return bgr_enhanced
-
-
-def process_color_image(image, mode="adjusted"):
-    """
-    统一的彩色图像处理函数
-
-    Args:
-        image: 输入图像 (BGR格式)
-        mode: 处理模式
-            - "original": 原色彩模式，仅做轻微调整
-            - "adjusted": 调色模式，使用lab_enhance进行增强
-            - "enhanced": 暴力上色模式，开启均衡化的强化处理
-
-    Returns:
-        处理后的图像 (BGR格式)
-    """
-    if mode == "original":
-        # 原色彩模式：使用lab_enhance进行轻微调整
-        return lab_enhance(
-            image,
-            l_adjust=1.1,  # 轻微提升亮度
-            ab_adjust=1.02,  # 轻微提升色彩饱和度
-            equalization=False,  # 不进行均衡化
-        )
-
-    elif mode == "enhanced":
-        # 暴力上色模式：开启均衡化的强化处理
-        # 先应用白平衡处理
-        white_balanced_image = apply_white_balance(image, "color")
-
-        # 然后使用lab_enhance进行强化增强
-        return lab_enhance(
-            white_balanced_image,
-            l_adjust=1.3,  # 大幅提升亮度
-            ab_adjust=1.25,  # 大幅增强色彩饱和度
-            equalization=True,  # 开启均衡化
-        )
-
-    else:  # mode == "adjusted"
-        # 调色模式：使用lab_enhance进行完整处理
-        # 先应用白平衡处理
-        white_balanced_image = apply_white_balance(image, "color")
-
-        # 然后使用lab_enhance进行增强
-        return lab_enhance(
-            white_balanced_image,
-            l_adjust=1.2,  # 提升亮度
-            ab_adjust=1.15,  # 增强色彩饱和度
-            equalization=False,  # 均衡化效果不好，也不进行均衡化
-        )
-
-
-def process_grayscale_image(image, detail_level="standard"):
-    """
-    统一的黑白图像处理函数
-
-    Args:
-        image: 输入图像 (BGR格式)
-        detail_level: 细节级别
-            - "minimal": 仅转换黑白（轻度CLAHE和高斯模糊）
-            - "standard": 标准处理（未经均衡化）
-            - "more": 较多细节（轻度CLAHE）
-            - "most": 更多细节（中度CLAHE）
-            - "extreme": 暴力细节（重度CLAHE）
-            - "silhouette": 极简剪影（Otsu算法）
-
-    Returns:
-        处理后的图像 (BGR格式)
-    """
-
-    # 特殊处理：极简剪影效果（修正的Otsu算法）
-    if detail_level == "silhouette":
-        # 转换为LAB色彩空间
-        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-        L, A, B = cv2.split(lab)
-
-        # 应用高斯模糊减少噪声影响
-        L_blurred = cv2.GaussianBlur(L, (3, 3), 0)
-
-        # 使用Otsu算法自动确定最佳阈值，然后提高阈值以保留更多细、浅的像素
-        otsu_threshold, _ = cv2.threshold(
-            L_blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
-        )
-        adjusted_threshold = (
-            otsu_threshold * 1.15
-        )  # 提高阈值15%以保留更多细节和浅色像素
-
-        # 应用调整后的阈值
-        _, L_binary = cv2.threshold(
-            L_blurred, adjusted_threshold, 255, cv2.THRESH_BINARY
-        )
-
-        # 轻微形态学操作平滑边缘
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
-        L_final = cv2.morphologyEx(L_binary, cv2.MORPH_CLOSE, kernel)
-
-        # 转换回3通道BGR格式
-        return cv2.cvtColor(L_final, cv2.COLOR_GRAY2BGR)
-
-    # 定义不同级别的处理参数
-    params = {
-        "minimal": {
-            "use_clahe": True,
-            "clip_limit": 1.5,
-            "tile_grid_size": (8, 8),
-            "use_minimal_processing": True,  # 特殊标记，只做轻度CLAHE和高斯模糊
-        },
-        "standard": {
-            "use_clahe": False,
-            "brightness": 1.1,
-            "contrast": 1.2,
-            "gamma": 0.9,
-            "final_contrast": 1.3,
-            "curve_strength": 1.5,
-        },
-        "more": {
-            "use_clahe": True,
-            "clip_limit": 2.0,
-            "tile_grid_size": (8, 8),
-            "brightness": 1.15,
-            "contrast": 1.25,
-            "gamma": 0.85,
-            "final_contrast": 1.4,
-            "curve_strength": 1.8,
-        },
-        "most": {
-            "use_clahe": True,
-            "clip_limit": 3.0,
-            "tile_grid_size": (8, 8),
-            "brightness": 1.1,
-            "contrast": 1.15,
-            "gamma": 0.95,
-            "final_contrast": 1.2,
-            "curve_strength": 1.3,
-        },
-        "extreme": {
-            "use_clahe": True,
-            "clip_limit": 4.0,
-            "tile_grid_size": (6, 6),
-            "brightness": 1.05,
-            "contrast": 1.08,
-            "gamma": 0.98,
-            "final_contrast": 1.1,
-            "curve_strength": 1.1,
-        },
-    }
-
-    # 获取当前级别的参数
-    p = params.get(detail_level, params["standard"])
+    if not filename:
+        return jsonify({"error": "缺少文件名参数"}), 400
 
-    # 1. 先转换为灰度图像
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    try:
+        import imaging
 
-    # 特殊处理：仅转换黑白（minimal模式）
-    if p.get("use_minimal_processing", False):
-        # 轻度CLAHE处理
-        clahe = cv2.createCLAHE(
-            clipLimit=p["clip_limit"], tileGridSize=p["tile_grid_size"]
-        )
-        clahe_image = clahe.apply(gray_image)
+        image_path = os.path.join(app.config["PROCESSED_FOLDER"], filename)
+        width, height = imaging.probe_size(image_path) or (None, None)
+        with admission_control.admit(estimate_cost(width, height, "rotate")):
+            # 保持结果的通道布局（黑白结果不会被扩展为彩色）
+            image = imaging.read_result(image_path)
 
-        # 高斯模糊
-        blurred_image = cv2.GaussianBlur(clahe_image, (3, 3), 0.5)
+            if image is None:
+                return jsonify({"error": "无法读取图像文件"}), 400
 
-        # 转换回3通道BGR格式
-        return cv2.cvtColor(blurred_image, cv2.COLOR_GRAY2BGR)
+            # Rotate image
+            rotated = imaging.rotate(image, angle)
+            if rotated is None:
+                return jsonify({"error": "不支持的旋转角度"}), 400
 
-    # 2. CLAHE处理（非minimal模式）
-    if p.get("use_clahe", False):
-        clahe = cv2.createCLAHE(
-            clipLimit=p["clip_limit"], tileGridSize=p["tile_grid_size"]
-        )
-        processed_image = clahe.apply(gray_image)
-    else:
-        processed_image = gray_image
+            # Save rotated image (overwrite)，只编码一次
+            png_data = imaging.encode_png(rotated)
+            write_file(image_path, png_data)
 
-    # 3. 转换为PIL格式进行后续处理
-    pil_image = Image.fromarray(processed_image, mode="L")
+            # Convert to base64 for frontend
+            img_base64 = base64.b64encode(png_data).decode("utf-8")
 
-    # 4. 亮度调整
-    brightness_enhancer = ImageEnhance.Brightness(pil_image)
-    brightened = brightness_enhancer.enhance(p["brightness"])
+        return jsonify({"success": True, "image_data": img_base64})
 
-    # 5. 对比度调整
-    contrast_enhancer = ImageEnhance.Contrast(brightened)
-    contrasted = contrast_enhancer.enhance(p["contrast"])
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": f"旋转失败: {str(e)}"}), 500
 
-    # 6. Gamma校正
-    def gamma_correct(x):
-        normalized = x / 255.0
-        corrected = pow(normalized, p["gamma"])
-        return int(corrected * 255)
 
-    gamma_corrected = contrasted.point(gamma_correct)
+@app.route("/tiles/<filename>/<int:level>/<int:x>_<int:y>.jpg")
+def get_tile(filename, level, x, y):
+    """获取上传图像金字塔中的一个瓦片（放大镜按需加载）"""
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], secure_filename(filename))
+    return send_from_directory(
+        os.path.abspath(pyramid_path(filepath)), f"{level}/{x}_{y}.jpg", max_age=86400
+    )
 
-    # 7. 最终对比度调整
-    final_contrast_enhancer = ImageEnhance.Contrast(gamma_corrected)
-    contrast_enhanced = final_contrast_enhancer.enhance(p["final_contrast"])
 
-    # 8. S曲线调整
-    def curve_adjust(x):
-        normalized = x / 255.0
-        strength = p["curve_strength"]
-        if normalized < 0.5:
-            enhanced = strength * normalized * normalized
+@app.route("/download/<filename>")
+def download_file(filename):
+    """下载处理后的图像"""
+    try:
+        file_path = os.path.join(app.config["PROCESSED_FOLDER"], filename)
+        if os.path.exists(file_path):
+            return send_file(file_path, as_attachment=True)
         else:
-            enhanced = 1 - strength * (1 - normalized) * (1 - normalized)
-        return int(min(255, max(0, enhanced * 255)))
-
-    curve_enhanced = contrast_enhanced.point(curve_adjust)
-
-    # 9. 转换回3通道BGR格式
-    final_array = np.array(curve_enhanced)
-    result = cv2.cvtColor(final_array, cv2.COLOR_GRAY2BGR)
-
-    return result
+            return jsonify({"error": "文件不存在"}), 404
+    except Exception as e:
+        return jsonify({"error": f"下载失败: {str(e)}"}), 500
 
 
 # ===== CLI Commands =====
@@ -888,7 +959,11 @@ def cleanup_old_files(days, quiet):
         click.echo(f"清理早于 {cutoff_date} 的文件...")
 
     # 要清理的目录
-    folders = [app.config["UPLOAD_FOLDER"], app.config["PROCESSED_FOLDER"]]
+    folders = [
+        app.config["UPLOAD_FOLDER"],
+        app.config["PROCESSED_FOLDER"],
+        INFLIGHT_FOLDER,
+    ]
 
     total_deleted = 0
     total_size = 0
@@ -908,6 +983,25 @@ def cleanup_old_files(days, quiet):
             for filename in os.listdir(folder):
                 filepath = os.path.join(folder, filename)
 
+                # 原始像素文件和瓦片金字塔随其上传文件一起清理；
+                # 上传文件已不存在时视为孤立文件直接删除
+                source_path = upload_artifact_source(filepath)
+                if source_path is not None:
+                    # 可能已随同一上传文件的其他派生文件一起删除
+                    if os.path.exists(filepath) and not os.path.exists(source_path):
+                        try:
+                            file_size = remove_upload_artifacts(source_path)
+                            folder_deleted += 1
+                            folder_size += file_size
+                            if not quiet:
+                                click.echo(f"  已删除孤立文件: {filename}")
+                        except OSError as e:
+                            if not quiet:
+                                click.echo(
+                                    f"  警告: 无法删除 {filename}: {e}", err=True
+                                )
+                    continue
+
                 # 跳过目录，只处理文件
                 if not os.path.isfile(filepath):
                     continue
@@ -926,6 +1020,10 @@ def cleanup_old_files(days, quiet):
                     if file_mtime < cutoff_date:
                         file_size = os.path.getsize(filepath)
                         os.remove(filepath)
+
+                        # 同时删除对应的原始像素文件和瓦片金字塔
+                        file_size += remove_upload_artifacts(filepath)
+
                         folder_deleted += 1
                         folder_size += file_size
                         if not quiet:
@@ -949,6 +1047,12 @@ def cleanup_old_files(days, quiet):
         total_deleted += folder_deleted
         total_size += folder_size
 
+    # 超过有效期仍未完成的分块上传会话
+    session_size = upload_sessions.prune()
+    total_size += session_size
+    if not quiet and session_size:
+        click.echo(f"\n已删除过期的上传会话，释放 {session_size / 1024 / 1024:.2f} MB")
+
     # 最终统计信息始终输出（无论是否静默模式）
     if not quiet:
         click.echo("\n清理完成！")
@@ -0,0 +1,209 @@
+"""
+ASGI入口：异步处理慢速上传/下载，CPU密集的图像处理在有限的线程池中执行
+
+慢速客户端的请求体先在事件循环中完整缓冲（超过阈值写入临时文件），
+之后才占用一个计算线程调用 Flask 应用；响应体同样在计算线程之外发送。
+这样并发的慢速连接数量与 CPU 计算槽位数量互不影响。
+
+用法:
+    gunicorn -k uvicorn_worker.UvicornWorker -w 2 asgi:application
+    uvicorn asgi:application --host 127.0.0.1 --port 5000
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+from app import app
+
+# 每个进程同时执行 Flask 请求（图像处理）的线程数
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", str(os.cpu_count() or 1)))
+# 请求体超过该大小后缓冲到临时文件
+BODY_SPOOL_SIZE = int(os.environ.get("BODY_SPOOL_SIZE", str(1024 * 1024)))
+# 下载文件时每次发送的块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class BufferedWSGIAdapter:
+    """
+    将 WSGI 应用包装为 ASGI 应用
+
+    - 请求体在事件循环中读取完毕后才进入计算线程池
+    - 响应体的迭代（如 send_file 读取文件）在默认 I/O 线程池中进行
+    """
+
+    def __init__(self, wsgi_app, compute_workers=COMPUTE_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(
+            max_workers=compute_workers, thread_name_prefix="compute"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        max_length = app.config.get("MAX_CONTENT_LENGTH")
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        try:
+            # 1. 在事件循环中缓冲完整请求体，不占用计算线程
+            length = 0
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk = message.get("body", b"")
+                length += len(chunk)
+                if max_length and length > max_length:
+                    await self._send_simple(send, 413, b"Request Entity Too Large")
+                    return
+                body.write(chunk)
+                if not message.get("more_body", False):
+                    break
+            body.seek(0)
+
+            # 2. 在计算线程池中执行 Flask 应用
+            loop = asyncio.get_running_loop()
+            environ = self._build_environ(scope, body, length)
+            status, headers, iterator, close = await loop.run_in_executor(
+                self.executor, self._run_app, environ
+            )
+
+            # 3. 在计算线程之外发送响应体
+            try:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": status,
+                        "headers": headers,
+                    }
+                )
+                while True:
+                    chunk = await loop.run_in_executor(None, next, iterator, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send(
+                            {
+                                "type": "http.response.body",
+                                "body": chunk,
+                                "more_body": True,
+                            }
+                        )
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                if close is not None:
+                    await loop.run_in_executor(None, close)
+        finally:
+            body.close()
+
+    def _run_app(self, environ):
+        """在计算线程中调用 WSGI 应用，返回状态、响应头和响应体迭代器"""
+        response = {}
+        pending = []
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+            return pending.append
+
+        iterable = self.wsgi_app(environ, start_response)
+        iterator = iter(iterable)
+
+        # 部分 WSGI 应用在首次迭代时才调用 start_response
+        if "status" not in response:
+            first = next(iterator, b"")
+            iterator = _prepend(first, iterator)
+        if pending:
+            iterator = _prepend(b"".join(pending), iterator)
+
+        return (
+            response["status"],
+            response["headers"],
+            iterator,
+            getattr(iterable, "close", None),
+        )
+
+    @staticmethod
+    def _build_environ(scope, body, length):
+        """根据 ASGI scope 构造 PEP 3333 environ"""
+        script_name = scope.get("root_path", "") or os.environ.get("SCRIPT_NAME", "")
+        path = scope["path"]
+        if script_name and path.startswith(script_name):
+            path = path[len(script_name) :]
+
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": script_name.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(length),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+            "wsgi.file_wrapper": lambda file, block_size=STREAM_CHUNK_SIZE: (
+                FileWrapper(file, block_size)
+            ),
+        }
+
+        for raw_name, raw_value in scope.get("headers", []):
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            if name == "CONTENT_LENGTH":
+                continue
+            if name != "CONTENT_TYPE":
+                name = f"HTTP_{name}"
+            if name in environ:
+                value = f"{environ[name]},{value}"
+            environ[name] = value
+
+        return environ
+
+    @staticmethod
+    async def _send_simple(send, status, body):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _prepend(first, iterator):
+    yield first
+    yield from iterator
+
+
+application = BufferedWSGIAdapter(app)
@@ -0,0 +1,52 @@
+"""
+跨 worker 进程共享状态用的文件锁
+
+singleflight、admission 和 resumable 都把状态放在共享目录的文件里，
+多个 Gunicorn worker 通过对同一文件加 fcntl.flock 排他锁来串行访问。
+flock 只在类 Unix 系统上可用（Gunicorn 的运行环境）。
+"""
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def locked(path, mode="a"):
+    """打开 path 并持有排他锁，产出文件对象；mode 为 "a"/"a+" 时文件不存在会被创建"""
+    with open(path, mode, encoding="utf-8") as locked_file:
+        fcntl.flock(locked_file, fcntl.LOCK_EX)
+        try:
+            yield locked_file
+        finally:
+            fcntl.flock(locked_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked_json(path, create=True):
+    """
+    在排他锁内读取 JSON 文件，正常退出时写回（修改产出的对象即可）
+
+    Args:
+        path: JSON 文件，同时作为锁文件
+        create: 文件不存在时是否按空字典创建；为 False 时抛出 FileNotFoundError，
+            等待锁期间文件被删除也视为不存在
+
+    with 块内抛出异常时不写回。
+    """
+    with locked(path, "a+" if create else "r+") as state_file:
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        state_file.seek(0)
+        try:
+            state = json.loads(state_file.read() or "{}")
+        except ValueError:
+            state = {}
+
+        yield state
+
+        state_file.seek(0)
+        state_file.truncate()
+        json.dump(state, state_file)
+        state_file.flush()
@@ -0,0 +1,39 @@
+"""
+Gunicorn 配置文件，从 .env 和环境变量读取配置
+
+用法: gunicorn --config gunicorn.conf.py app:app
+"""
+
+import gc
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 服务器绑定与 worker 数量
+bind = f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WORKERS", "4"))
+
+# 日志
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+errorlog = os.environ.get("LOG_FILE") or "-"
+
+# 在主进程中预加载应用，worker 通过 fork 共享已加载的代码和库
+preload_app = os.environ.get("PRELOAD_APP", "False").lower() == "true"
+
+
+def when_ready(server):
+    """主进程就绪、fork worker 之前执行"""
+    if not preload_app:
+        return
+
+    # app.py 不会主动导入图像处理栈，预加载模式下在主进程中提前导入，
+    # 避免每个 worker 在首个请求时各自加载一份
+    import imaging
+
+    imaging.warmup()
+
+    # 将现有对象移出GC跟踪，避免 worker 中的垃圾回收写入这些对象所在的内存页，
+    # 破坏 fork 后的写时复制共享
+    gc.freeze()
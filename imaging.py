@@ -0,0 +1,974 @@
+"""
+图像处理模块：透视校正、彩色/黑白后处理及相关的图像读写
+
+依赖 OpenCV、NumPy、PIL 和 pillow_heif，导入开销较大。
+app.py 仅在需要处理图像时才导入本模块，
+因此 `flask cleanup` 等命令和尚未处理图像的 worker 无需加载这些库。
+"""
+
+import io
+import json
+import os
+import threading
+import uuid
+import warnings
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+from pillow_heif import register_heif_opener
+
+# Register HEIF opener to enable HEIC/HEIF support in PIL
+register_heif_opener()
+
+# 像素上限（与 app.py 的 MAX_IMAGE_PIXELS 相同，0 表示不限制）。应用在解码前通过
+# probe_image() 检查并给出准确提示；PIL 自带的检查作为兜底，超过上限两倍的图片
+# 在 Image.open() 时即抛出 DecompressionBombError，其余情况下的警告由应用的检查代替
+Image.MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", "100000000")) or None
+warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+DecompressionBombError = Image.DecompressionBombError
+
+# 处理选项（与前端单选按钮保持一致）
+COLOR_OPTIONS = ("original", "adjusted", "enhanced")
+GRAYSCALE_OPTIONS = ("minimal", "standard", "more", "most", "extreme", "silhouette")
+
+
+def warmup():
+    """
+    预热图像处理栈
+
+    在 gunicorn --preload 的主进程中调用：导入本模块即完成库加载和HEIF注册，
+    这里再触发一次 OpenCV 的惰性初始化，使 fork 出的 worker 共享这些内存页。
+    """
+    sample = np.zeros((8, 8, 3), dtype=np.uint8)
+    cv2.cvtColor(sample, cv2.COLOR_BGR2LAB)
+    cv2.imencode(".png", sample)
+
+
+def read_image(path):
+    """读取BGR图像，OpenCV无法解码的格式（如HEIC）使用PIL读取，失败时返回 None"""
+    image = cv2.imread(path)
+    if image is not None:
+        return image
+    try:
+        with Image.open(path) as pil_image:
+            rgb = ImageOps.exif_transpose(pil_image).convert("RGB")
+            return cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2BGR)
+    except Exception:
+        return None
+
+
+def read_alpha(path):
+    """读取单通道Alpha图像，失败时返回 None"""
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def read_result(path):
+    """
+    读取处理结果PNG并保持其通道布局，失败时返回 None
+
+    黑白结果为单通道（含1位二值图），带Alpha的黑白结果为灰度+Alpha两通道，
+    彩色结果为BGR或BGRA。
+    """
+    try:
+        with Image.open(path) as pil_image:
+            mode = pil_image.mode
+            if mode == "LA":
+                return np.asarray(pil_image)
+    except Exception:
+        return None
+    if mode in ("1", "L"):
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+
+def save_pixels(store_path, image):
+    """
+    将解码后的像素保存为可内存映射的 .npy 文件（原子替换）
+
+    之后任何 worker 都可以通过 load_pixels() 直接映射像素，无需再次解码，
+    且多个进程共享同一份页缓存。
+    """
+    tmp_path = f"{store_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "wb") as store_file:
+        np.save(store_file, np.ascontiguousarray(image), allow_pickle=False)
+    os.replace(tmp_path, store_path)
+
+
+def load_pixels(store_path):
+    """以只读内存映射方式打开 save_pixels() 保存的像素"""
+    return np.load(store_path, mmap_mode="r", allow_pickle=False)
+
+
+# PIL 模式对应的每通道位深（未列出的模式为8位）
+MODE_BIT_DEPTHS = {"1": 1, "I;16": 16, "I;16B": 16, "I;16L": 16, "I": 32, "F": 32}
+# EXIF 方向标签；5～8 表示需要旋转90度，解码后宽高互换
+EXIF_ORIENTATION = 0x0112
+
+
+def header_orientation(pil_image):
+    """
+    读取打开文件时已解析的EXIF方向（JPEG的APP1段、HEIF的元数据），没有时返回 None
+
+    不调用 getexif()：对PNG等格式它会先 load() 解码全部像素来查找EXIF块。
+    """
+    exif_bytes = pil_image.info.get("exif")
+    if not exif_bytes:
+        return None
+    try:
+        exif = Image.Exif()
+        exif.load(exif_bytes)
+        return exif.get(EXIF_ORIENTATION)
+    except Exception:
+        return None
+
+
+def probe_image(path):
+    """
+    只读取容器文件头获取图像信息，不解码像素
+
+    宽高已按文件头中的EXIF方向换算，与 read_image() 解码后的尺寸一致。
+
+    Returns:
+        {"format", "mode", "width", "height", "channels", "bit_depth", "frames", "has_alpha"}，
+        无法识别时返回 None
+
+    Raises:
+        DecompressionBombError: 像素数超过 PIL 上限（MAX_IMAGE_PIXELS）的两倍
+    """
+    try:
+        with Image.open(path) as pil_image:
+            width, height = pil_image.size
+            if header_orientation(pil_image) in (5, 6, 7, 8):
+                width, height = height, width
+            mode = pil_image.mode
+            return {
+                "format": pil_image.format,
+                "mode": mode,
+                "width": width,
+                "height": height,
+                "channels": len(pil_image.getbands()),
+                "bit_depth": MODE_BIT_DEPTHS.get(mode, 8),
+                "frames": getattr(pil_image, "n_frames", 1),
+                "has_alpha": mode in ("RGBA", "LA", "PA")
+                or (mode == "P" and "transparency" in pil_image.info),
+            }
+    except DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+def probe_size(path):
+    """
+    只读取文件头获取图像尺寸（不解码像素），支持 save_pixels() 保存的 .npy 文件
+
+    Returns:
+        (width, height)，无法识别时返回 None
+    """
+    try:
+        if path.endswith(".npy"):
+            with open(path, "rb") as store_file:
+                version = np.lib.format.read_magic(store_file)
+                if version == (1, 0):
+                    shape = np.lib.format.read_array_header_1_0(store_file)[0]
+                else:
+                    shape = np.lib.format.read_array_header_2_0(store_file)[0]
+            return shape[1], shape[0]
+        with Image.open(path) as pil_image:
+            return pil_image.size
+    except (OSError, ValueError, DecompressionBombError):
+        return None
+
+
+def extract_alpha_channel(filepath, alpha_path):
+    """
+    检测图片是否带有Alpha通道，如有则保存到 alpha_path
+
+    Returns:
+        是否带有Alpha通道
+    """
+    # Use PIL to check for alpha channel
+    pil_image = Image.open(filepath)
+    if pil_image.mode in ("RGBA", "LA") or (
+        pil_image.mode == "P" and "transparency" in pil_image.info
+    ):
+        # Convert to RGBA if needed
+        if pil_image.mode != "RGBA":
+            pil_image = pil_image.convert("RGBA")
+
+        # Extract and save alpha channel
+        alpha_channel = pil_image.split()[-1]  # Get the alpha channel
+        alpha_channel.save(alpha_path)
+        return True
+    return False
+
+
+def merge_alpha(image, alpha_channel):
+    """将Alpha通道合并回处理后的图像：BGR → BGRA，单通道灰度 → 灰度+Alpha"""
+    if image.ndim == 2:
+        return cv2.merge([image, alpha_channel])
+    # Convert BGR to BGRA
+    merged = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    # Replace alpha channel
+    merged[:, :, 3] = alpha_channel
+    return merged
+
+
+def resize_to_fit(image, max_size):
+    """按最长边等比缩小（不放大）"""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_size / max(width, height))
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def rotate(image, angle):
+    """旋转90度（angle 为 90 或 -90），不支持的角度返回 None"""
+    if angle == 90:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if angle == -90:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return None
+
+
+def is_bilevel(image):
+    """单通道图像是否只包含纯黑和纯白像素"""
+    return image.ndim == 2 and cv2.countNonZero(cv2.inRange(image, 1, 254)) == 0
+
+
+def encode_png(image):
+    """
+    将图像编码为PNG字节，保持通道布局
+
+    - 只有黑白两色的单通道图像编码为1位二值PNG
+    - 灰度+Alpha两通道图像编码为LA格式（OpenCV不支持两通道PNG，使用PIL）
+    """
+    if image.ndim == 3 and image.shape[2] == 2:
+        output = io.BytesIO()
+        # 压缩级别与OpenCV默认值一致，优先编码速度
+        Image.fromarray(np.ascontiguousarray(image), "LA").save(
+            output, "PNG", compress_level=1
+        )
+        return output.getvalue()
+
+    params = [cv2.IMWRITE_PNG_BILEVEL, 1] if is_bilevel(image) else []
+    _, buffer = cv2.imencode(".png", image, params)
+    return buffer.tobytes()
+
+
+def build_pyramid(image, out_dir, overview_size=1024, tile_size=256, alpha=None):
+    """
+    生成用于区域选择画布和放大镜的多分辨率瓦片金字塔
+
+    - overview.jpg：长边不超过 overview_size 的整图（第0级）
+    - <level>/<x>_<y>.jpg：第1级起每级分辨率翻倍，直到原图尺寸，按 tile_size 切块
+    - info.json：各级尺寸信息（同时作为返回值）
+
+    带Alpha通道的图像先合成到白色背景上。
+    """
+    if alpha is not None:
+        weight = alpha.astype(np.float32)[:, :, None] / 255.0
+        image = (image * weight + 255.0 * (1.0 - weight)).astype(np.uint8)
+
+    height, width = image.shape[:2]
+    encode_params = [cv2.IMWRITE_JPEG_QUALITY, 85]
+    os.makedirs(out_dir, exist_ok=True)
+
+    scale = min(1.0, overview_size / max(width, height))
+    overview = resize_to_fit(image, overview_size)
+    cv2.imwrite(os.path.join(out_dir, "overview.jpg"), overview, encode_params)
+
+    info = {
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "overview": {"width": overview.shape[1], "height": overview.shape[0]},
+        "levels": [],
+    }
+
+    level = 0
+    while scale < 1.0:
+        level += 1
+        scale = min(1.0, scale * 2)
+        if scale < 1.0:
+            level_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            level_image = cv2.resize(image, level_size, interpolation=cv2.INTER_AREA)
+        else:
+            level_image = image
+        level_height, level_width = level_image.shape[:2]
+        cols = -(-level_width // tile_size)
+        rows = -(-level_height // tile_size)
+
+        level_dir = os.path.join(out_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for y in range(rows):
+            for x in range(cols):
+                tile = level_image[
+                    y * tile_size : (y + 1) * tile_size,
+                    x * tile_size : (x + 1) * tile_size,
+                ]
+                cv2.imwrite(os.path.join(level_dir, f"{x}_{y}.jpg"), tile, encode_params)
+
+        info["levels"].append(
+            {
+                "level": level,
+                "width": level_width,
+                "height": level_height,
+                "cols": cols,
+                "rows": rows,
+            }
+        )
+
+    with open(os.path.join(out_dir, "info.json"), "w") as info_file:
+        json.dump(info, info_file)
+    return info
+
+
+def expand_image_borders(filepath, grayscale=False):
+    """
+    为图片添加20%的白边
+
+    Returns:
+        (扩展后的文件路径, 扩展后的图像)；失败时返回 (原路径, None)
+    """
+    try:
+        # 读取图片
+        image = read_alpha(filepath) if grayscale else read_image(filepath)
+        if image is None:
+            return filepath, None
+
+        height, width = image.shape[:2]
+
+        # 计算边框大小（原图尺寸的20%）
+        border_x = int(width * 0.2)
+        border_y = int(height * 0.2)
+
+        # 添加白边
+        expanded_image = cv2.copyMakeBorder(
+            image,
+            border_y,
+            border_y,
+            border_x,
+            border_x,  # top, bottom, left, right
+            cv2.BORDER_CONSTANT,
+            value=[255, 255, 255],  # 白色边框
+        )
+
+        # 保存扩展后的图片，使用新的文件名（OpenCV无法写入的格式保存为PNG）
+        base_name, ext = os.path.splitext(filepath)
+        if ext.lower() not in (".png", ".jpg", ".jpeg", ".bmp"):
+            ext = ".png"
+        expanded_filepath = f"{base_name}_expanded{ext}"
+        cv2.imwrite(expanded_filepath, expanded_image)
+
+        # 删除原文件
+        os.remove(filepath)
+
+        return expanded_filepath, expanded_image
+
+    except Exception as e:
+        print(f"扩展图片边框时出错: {e}")
+        return filepath, None
+
+
+def perspective_transform(corners):
+    """
+    计算透视校正的变换矩阵和输出尺寸（perspective_correction() 与前端预览共用）
+
+    Args:
+        corners: 四个角点坐标（任意顺序）
+
+    Returns:
+        (matrix, (width, height), ordered_points)：3x3 变换矩阵、输出尺寸，
+        以及按左上、右上、右下、左下排序后的角点
+    """
+    # Convert corners to numpy array
+    src_points = np.array(corners, dtype=np.float32)
+
+    # 简化的角点排序：按照左上、右上、右下、左下的顺序
+    # 计算Y轴重心来分离上下两组点
+    center_y = np.mean(src_points[:, 1])
+
+    # 按照位置分类
+    top_points = []
+    bottom_points = []
+
+    for point in src_points:
+        if point[1] < center_y:
+            top_points.append(point)
+        else:
+            bottom_points.append(point)
+
+    # 确保每个部分有2个点
+    if len(top_points) != 2 or len(bottom_points) != 2:
+        # 如果分类失败，使用原始顺序
+        ordered_points = src_points
+    else:
+        # 在上方点中，左边的是左上，右边的是右上
+        top_points.sort(key=lambda p: p[0])
+        # 在下方点中，左边的是左下，右边的是右下
+        bottom_points.sort(key=lambda p: p[0])
+
+        # 按照左上、右上、右下、左下的顺序排列
+        ordered_points = np.array(
+            [
+                top_points[0],  # 左上
+                top_points[1],  # 右上
+                bottom_points[1],  # 右下
+                bottom_points[0],  # 左下
+            ],
+            dtype=np.float32,
+        )
+
+    # Calculate the width and height of the corrected image
+    width_top = np.linalg.norm(ordered_points[1] - ordered_points[0])
+    width_bottom = np.linalg.norm(ordered_points[2] - ordered_points[3])
+    width = int((width_top + width_bottom) / 2)
+
+    height_left = np.linalg.norm(ordered_points[3] - ordered_points[0])
+    height_right = np.linalg.norm(ordered_points[2] - ordered_points[1])
+    height = int((height_left + height_right) / 2)
+
+    # Define destination points for a rectangle
+    dst_points = np.array(
+        [[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32
+    )
+
+    # Calculate perspective transformation matrix
+    matrix = cv2.getPerspectiveTransform(ordered_points, dst_points)
+
+    return matrix, (width, height), ordered_points
+
+
+def perspective_correction(image, corners, alpha_channel=None):
+    """
+    透视校正 - 改进版本，提供更自然的纵横比
+
+    Args:
+        image: 输入图像 (BGR格式)
+        corners: 四个角点坐标
+        alpha_channel: 可选的Alpha通道图像（灰度图）
+
+    Returns:
+        corrected: 校正后的图像
+        corrected_alpha: 校正后的Alpha通道（如果提供了alpha_channel）
+    """
+    matrix, (width, height), _ = perspective_transform(corners)
+
+    # Apply perspective transformation to the main image
+    corrected = cv2.warpPerspective(image, matrix, (width, height))
+
+    # Apply the same transformation to alpha channel if provided
+    corrected_alpha = None
+    if alpha_channel is not None:
+        corrected_alpha = cv2.warpPerspective(alpha_channel, matrix, (width, height))
+
+    if alpha_channel is not None:
+        return corrected, corrected_alpha
+    return corrected
+
+
+class ProcessingContext:
+    """
+    单个工作线程内复用的图像处理上下文
+
+    缓存按参数构建的CLAHE实例、形态学结构元素和查找表，
+    并为中间结果保留按最近一次图像尺寸分配的临时缓冲区。
+    CLAHE实例内部带有工作缓冲区，不能跨线程共享，
+    因此每个线程通过 get_processing_context() 获取自己的上下文。
+    """
+
+    def __init__(self):
+        self._clahe = {}
+        self._kernels = {}
+        self._luts = {}
+        self._buffers = {}
+
+    def clahe(self, clip_limit, tile_grid_size):
+        """获取指定 (clip_limit, tile_grid_size) 的CLAHE实例"""
+        key = (float(clip_limit), tuple(tile_grid_size))
+        clahe = self._clahe.get(key)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=key[0], tileGridSize=key[1])
+            self._clahe[key] = clahe
+        return clahe
+
+    def kernel(self, shape, ksize):
+        """获取形态学结构元素"""
+        key = (shape, tuple(ksize))
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            kernel = cv2.getStructuringElement(shape, key[1])
+            self._kernels[key] = kernel
+        return kernel
+
+    def lut(self, key, builder):
+        """获取256项uint8查找表，首次使用时由 builder() 构建"""
+        table = self._luts.get(key)
+        if table is None:
+            table = builder()
+            self._luts[key] = table
+        return table
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """
+        获取临时缓冲区，尺寸与上次相同时直接复用
+
+        缓冲区内容会被下一次调用覆盖，只能用于不会返回给调用方的中间结果。
+        """
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
+
+
+_processing_local = threading.local()
+
+
+def get_processing_context():
+    """获取当前线程的图像处理上下文"""
+    context = getattr(_processing_local, "context", None)
+    if context is None:
+        context = ProcessingContext()
+        _processing_local.context = context
+    return context
+
+
+class ImageIntermediates:
+    """
+    同一张校正后图像在多个处理选项之间共享的中间结果
+
+    各项在首次使用时计算并缓存，调用方不得修改返回的数组。
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self._cache = {}
+
+    def _get(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            self._cache[key] = value
+        return value
+
+    def lab(self):
+        return self._get("lab", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2LAB))
+
+    def gray(self):
+        return self._get("gray", lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    def white_balanced(self):
+        return self._get(
+            "white_balanced", lambda: apply_white_balance(self.image, "color")
+        )
+
+    def white_balanced_lab(self):
+        return self._get(
+            "white_balanced_lab",
+            lambda: cv2.cvtColor(self.white_balanced(), cv2.COLOR_BGR2LAB),
+        )
+
+
+def _scale_lut(factor):
+    """L通道线性缩放查找表，与 np.clip(x * factor) 的float32计算结果一致"""
+    values = np.arange(256, dtype=np.float32) * np.float32(factor)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def _chroma_lut(factor):
+    """A/B通道围绕128缩放的查找表"""
+    values = (np.arange(256, dtype=np.float32) - 128) * np.float32(factor) + 128
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def _gamma_lut(gamma):
+    """Gamma校正查找表（PIL point 格式）"""
+    return [int(pow(x / 255.0, gamma) * 255) for x in range(256)]
+
+
+def _curve_lut(strength):
+    """S曲线调整查找表（PIL point 格式）"""
+    table = []
+    for x in range(256):
+        normalized = x / 255.0
+        if normalized < 0.5:
+            enhanced = strength * normalized * normalized
+        else:
+            enhanced = 1 - strength * (1 - normalized) * (1 - normalized)
+        table.append(int(min(255, max(0, enhanced * 255))))
+    return table
+
+
+def histogram_equalization(image, clip_limit=3.0, tile_grid_size=(8, 8), lab=None):
+    """直方图均衡化处理，支持彩色和灰度图像（彩色图像可传入已计算的LAB）"""
+    context = get_processing_context()
+    clahe = context.clahe(clip_limit, tile_grid_size)
+
+    # 判断是彩色还是灰度图像
+    if len(image.shape) == 3:
+        # 彩色图像：在LAB色彩空间中对L通道进行均衡化
+        lab_buffer = context.buffer("lab", image.shape)
+        if lab is None:
+            lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=lab_buffer)
+        l_channel, a_channel, b_channel = cv2.split(lab)
+
+        # 对L通道进行CLAHE（限制对比度自适应直方图均衡化）
+        l_equalized = clahe.apply(l_channel)
+
+        # 重新合并通道（写入临时缓冲区，不修改传入的LAB）
+        lab_equalized = cv2.merge([l_equalized, a_channel, b_channel], dst=lab_buffer)
+
+        # 转换回BGR色彩空间
+        result = cv2.cvtColor(lab_equalized, cv2.COLOR_LAB2BGR)
+
+        return result
+    else:
+        # 灰度图像：直接进行CLAHE
+        return clahe.apply(image)
+
+
+def apply_white_balance(image, mode="color"):
+    """
+    统一的白平衡处理函数
+
+    Args:
+        image: 输入图像 (BGR格式)
+        mode: 处理模式
+            - "color": 彩色图像白平衡，使用加权目标和极值过滤
+            - "grayscale": 灰度图像白平衡，使用简单目标和保守处理
+
+    Returns:
+        处理后的图像 (BGR格式)
+    """
+    # Convert BGR to RGB for PIL processing
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    pil_image = Image.fromarray(image_rgb)
+
+    # 分离RGB通道
+    r, g, b = pil_image.split()
+    r_array = np.array(r, dtype=np.float32)
+    g_array = np.array(g, dtype=np.float32)
+    b_array = np.array(b, dtype=np.float32)
+
+    if mode == "color":
+        # 彩色模式：使用robust mean和加权目标
+        def get_robust_mean(channel_array):
+            # 排除极值，只考虑中间范围的像素
+            mask = (channel_array > 30) & (channel_array < 225)
+            if np.sum(mask) > 0:
+                return np.mean(channel_array[mask])
+            else:
+                return np.mean(channel_array)
+
+        r_avg = get_robust_mean(r_array)
+        g_avg = get_robust_mean(g_array)
+        b_avg = get_robust_mean(b_array)
+
+        # 使用 Rec.601 加权平均
+        target = r_avg * 0.299 + g_avg * 0.587 + b_avg * 0.114
+
+        # 因子限制范围
+        factor_range = (0.8, 1.5)
+
+    else:  # mode == "grayscale"
+        # 灰度模式：使用简单mean和保守目标
+        r_avg = np.mean(r_array)
+        g_avg = np.mean(g_array)
+        b_avg = np.mean(b_array)
+
+        # 使用 Rec.601 加权平均
+        target = r_avg * 0.299 + g_avg * 0.587 + b_avg * 0.114
+
+        # 更保守的因子限制，保留更多细节
+        factor_range = (0.85, 1.5)
+
+    # 计算调整因子
+    r_factor = target / r_avg if r_avg > 0 else 1
+    g_factor = target / g_avg if g_avg > 0 else 1
+    b_factor = target / b_avg if b_avg > 0 else 1
+
+    # 应用因子限制
+    r_factor = min(max(r_factor, factor_range[0]), factor_range[1])
+    g_factor = min(max(g_factor, factor_range[0]), factor_range[1])
+    b_factor = min(max(b_factor, factor_range[0]), factor_range[1])
+
+    # 应用白平衡调整
+    r_balanced = np.clip(r_array * r_factor, 0, 255).astype(np.uint8)
+    g_balanced = np.clip(g_array * g_factor, 0, 255).astype(np.uint8)
+    b_balanced = np.clip(b_array * b_factor, 0, 255).astype(np.uint8)
+
+    # 重新构建图像
+    r_img = Image.fromarray(r_balanced)
+    g_img = Image.fromarray(g_balanced)
+    b_img = Image.fromarray(b_balanced)
+    balanced = Image.merge("RGB", (r_img, g_img, b_img))
+
+    # Convert back to BGR for OpenCV
+    final_array = np.array(balanced)
+    return cv2.cvtColor(final_array, cv2.COLOR_RGB2BGR)
+
+
+def lab_enhance(image, l_adjust=1.0, ab_adjust=1.0, equalization=False, lab=None):
+    """
+    LAB色彩空间增强函数，统一处理亮度、色度调整和均衡化
+
+    Args:
+        image: 输入图像 (BGR格式)
+        l_adjust: L通道(亮度)调整系数，1.0表示不调整
+        ab_adjust: A和B通道(色度)调整系数，1.0表示不调整，>1.0增加饱和度
+        equalization: 是否进行直方图均衡化
+        lab: 可选，image 已计算好的LAB图像（只读）
+
+    Returns:
+        处理后的图像 (BGR格式)
+    """
+    # 如果需要均衡化，先进行直方图均衡化
+    if equalization:
+        image = histogram_equalization(image, lab=lab)
+        lab = None
+
+    context = get_processing_context()
+    lab_buffer = context.buffer("lab", image.shape)
+
+    # 转换为LAB色彩空间
+    if lab is None:
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=lab_buffer)
+    l_channel, a_channel, b_channel = cv2.split(lab)
+
+    # L通道(亮度)调整
+    if l_adjust != 1.0:
+        l_lut = context.lut(("scale", l_adjust), lambda: _scale_lut(l_adjust))
+        l_channel = cv2.LUT(l_channel, l_lut)
+
+    # A和B通道(色度)调整
+    if ab_adjust != 1.0:
+        # A和B通道的值域是-128到127，需要围绕128缩放
+        ab_lut = context.lut(("chroma", ab_adjust), lambda: _chroma_lut(ab_adjust))
+        a_channel = cv2.LUT(a_channel, ab_lut)
+        b_channel = cv2.LUT(b_channel, ab_lut)
+
+    # 重新合并LAB通道（写入临时缓冲区，不修改传入的LAB）
+    lab_enhanced = cv2.merge([l_channel, a_channel, b_channel], dst=lab_buffer)
+
+    # 转换回BGR色彩空间
+    bgr_enhanced = cv2.cvtColor(lab_enhanced, cv2.COLOR_LAB2BGR)
+
+    return bgr_enhanced
+
+
+def process_color_image(image, mode="adjusted", intermediates=None):
+    """
+    统一的彩色图像处理函数
+
+    Args:
+        image: 输入图像 (BGR格式)
+        mode: 处理模式
+            - "original": 原色彩模式，仅做轻微调整
+            - "adjusted": 调色模式，使用lab_enhance进行增强
+            - "enhanced": 暴力上色模式，开启均衡化的强化处理
+        intermediates: 可选的 ImageIntermediates，多个选项共用白平衡和LAB结果
+
+    Returns:
+        处理后的图像 (BGR格式)
+    """
+    if mode == "original":
+        # 原色彩模式：使用lab_enhance进行轻微调整
+        return lab_enhance(
+            image,
+            l_adjust=1.1,  # 轻微提升亮度
+            ab_adjust=1.02,  # 轻微提升色彩饱和度
+            equalization=False,  # 不进行均衡化
+            lab=intermediates.lab() if intermediates else None,
+        )
+
+    # 先应用白平衡处理
+    if intermediates:
+        white_balanced_image = intermediates.white_balanced()
+        white_balanced_lab = intermediates.white_balanced_lab()
+    else:
+        white_balanced_image = apply_white_balance(image, "color")
+        white_balanced_lab = None
+
+    if mode == "enhanced":
+        # 暴力上色模式：开启均衡化的强化处理
+        return lab_enhance(
+            white_balanced_image,
+            l_adjust=1.3,  # 大幅提升亮度
+            ab_adjust=1.25,  # 大幅增强色彩饱和度
+            equalization=True,  # 开启均衡化
+            lab=white_balanced_lab,
+        )
+
+    else:  # mode == "adjusted"
+        # 调色模式：使用lab_enhance进行增强
+        return lab_enhance(
+            white_balanced_image,
+            l_adjust=1.2,  # 提升亮度
+            ab_adjust=1.15,  # 增强色彩饱和度
+            equalization=False,  # 均衡化效果不好，也不进行均衡化
+            lab=white_balanced_lab,
+        )
+
+
+# 黑白模式不同细节级别的处理参数
+GRAYSCALE_PARAMS = {
+    "minimal": {
+        "use_clahe": True,
+        "clip_limit": 1.5,
+        "tile_grid_size": (8, 8),
+        "use_minimal_processing": True,  # 特殊标记，只做轻度CLAHE和高斯模糊
+    },
+    "standard": {
+        "use_clahe": False,
+        "brightness": 1.1,
+        "contrast": 1.2,
+        "gamma": 0.9,
+        "final_contrast": 1.3,
+        "curve_strength": 1.5,
+    },
+    "more": {
+        "use_clahe": True,
+        "clip_limit": 2.0,
+        "tile_grid_size": (8, 8),
+        "brightness": 1.15,
+        "contrast": 1.25,
+        "gamma": 0.85,
+        "final_contrast": 1.4,
+        "curve_strength": 1.8,
+    },
+    "most": {
+        "use_clahe": True,
+        "clip_limit": 3.0,
+        "tile_grid_size": (8, 8),
+        "brightness": 1.1,
+        "contrast": 1.15,
+        "gamma": 0.95,
+        "final_contrast": 1.2,
+        "curve_strength": 1.3,
+    },
+    "extreme": {
+        "use_clahe": True,
+        "clip_limit": 4.0,
+        "tile_grid_size": (6, 6),
+        "brightness": 1.05,
+        "contrast": 1.08,
+        "gamma": 0.98,
+        "final_contrast": 1.1,
+        "curve_strength": 1.1,
+    },
+}
+
+
+def process_grayscale_image(image, detail_level="standard", intermediates=None):
+    """
+    统一的黑白图像处理函数
+
+    Args:
+        image: 输入图像 (BGR格式)
+        detail_level: 细节级别
+            - "minimal": 仅转换黑白（轻度CLAHE和高斯模糊）
+            - "standard": 标准处理（未经均衡化）
+            - "more": 较多细节（轻度CLAHE）
+            - "most": 更多细节（中度CLAHE）
+            - "extreme": 暴力细节（重度CLAHE）
+            - "silhouette": 极简剪影（Otsu算法）
+        intermediates: 可选的 ImageIntermediates，多个选项共用LAB和灰度结果
+
+    Returns:
+        处理后的单通道灰度图像（剪影为只含0和255的二值图像）
+    """
+
+    context = get_processing_context()
+
+    # 特殊处理：极简剪影效果（修正的Otsu算法）
+    if detail_level == "silhouette":
+        # 转换为LAB色彩空间
+        if intermediates:
+            lab = intermediates.lab()
+        else:
+            lab = cv2.cvtColor(
+                image, cv2.COLOR_BGR2LAB, dst=context.buffer("lab", image.shape)
+            )
+        L, A, B = cv2.split(lab)
+
+        # 应用高斯模糊减少噪声影响
+        L_blurred = cv2.GaussianBlur(L, (3, 3), 0)
+
+        # 使用Otsu算法自动确定最佳阈值，然后提高阈值以保留更多细、浅的像素
+        otsu_threshold, _ = cv2.threshold(
+            L_blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+        )
+        adjusted_threshold = (
+            otsu_threshold * 1.15
+        )  # 提高阈值15%以保留更多细节和浅色像素
+
+        # 应用调整后的阈值
+        _, L_binary = cv2.threshold(
+            L_blurred, adjusted_threshold, 255, cv2.THRESH_BINARY
+        )
+
+        # 轻微形态学操作平滑边缘
+        kernel = context.kernel(cv2.MORPH_ELLIPSE, (2, 2))
+        L_final = cv2.morphologyEx(L_binary, cv2.MORPH_CLOSE, kernel)
+
+        return L_final
+
+    # 获取当前级别的参数
+    p = GRAYSCALE_PARAMS.get(detail_level, GRAYSCALE_PARAMS["standard"])
+
+    # 1. 先转换为灰度图像
+    if intermediates:
+        gray_image = intermediates.gray()
+    else:
+        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # 特殊处理：仅转换黑白（minimal模式）
+    if p.get("use_minimal_processing", False):
+        # 轻度CLAHE处理
+        clahe = context.clahe(p["clip_limit"], p["tile_grid_size"])
+        clahe_image = clahe.apply(gray_image)
+
+        # 高斯模糊
+        blurred_image = cv2.GaussianBlur(clahe_image, (3, 3), 0.5)
+
+        return blurred_image
+
+    # 2. CLAHE处理（非minimal模式）
+    if p.get("use_clahe", False):
+        clahe = context.clahe(p["clip_limit"], p["tile_grid_size"])
+        processed_image = clahe.apply(gray_image)
+    else:
+        processed_image = gray_image
+
+    # 3. 转换为PIL格式进行后续处理
+    pil_image = Image.fromarray(processed_image, mode="L")
+
+    # 4. 亮度调整
+    brightness_enhancer = ImageEnhance.Brightness(pil_image)
+    brightened = brightness_enhancer.enhance(p["brightness"])
+
+    # 5. 对比度调整
+    contrast_enhancer = ImageEnhance.Contrast(brightened)
+    contrasted = contrast_enhancer.enhance(p["contrast"])
+
+    # 6. Gamma校正
+    gamma_table = context.lut(("gamma", p["gamma"]), lambda: _gamma_lut(p["gamma"]))
+    gamma_corrected = contrasted.point(gamma_table)
+
+    # 7. 最终对比度调整
+    final_contrast_enhancer = ImageEnhance.Contrast(gamma_corrected)
+    contrast_enhanced = final_contrast_enhancer.enhance(p["final_contrast"])
+
+    # 8. S曲线调整
+    curve_table = context.lut(
+        ("curve", p["curve_strength"]), lambda: _curve_lut(p["curve_strength"])
+    )
+    curve_enhanced = contrast_enhanced.point(curve_table)
+
+    # 9. 转换回numpy数组（保持单通道）
+    return np.array(curve_enhanced)
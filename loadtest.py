@@ -0,0 +1,740 @@
+"""
+端到端压力测试：按真实用户流程并发回放 上传 → 选择角点 → 处理 → 重新处理/旋转 → 下载
+
+每个模拟会话按前端的请求顺序依次执行:
+    /upload（--chunked 时为 /upload/sessions → PUT 分块 × K → finalize）
+    → /homography × H（角点确定后的透视预览）
+    → /process → /preview_options（每次处理后加载选项缩略图）
+    → /reprocess × N → /rotate × M → /download
+
+测试图片是离线生成的合成照片（桌面背景上一张带文字行的纸张，JPEG编码），
+尺寸可配置，角点使用纸张的真实位置。
+
+三种运行方式:
+    python loadtest.py                          # 进程内，通过 Flask test client 调用
+    python loadtest.py --gunicorn               # 启动本地 Gunicorn（临时目录和端口）后测试
+    python loadtest.py --url http://127.0.0.1:5000 --server-pid <主进程PID>
+
+输出每个接口的吞吐量、延迟百分位数、错误率，以及测试期间各进程的内存峰值。
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+ENDPOINTS = (
+    "upload",
+    "upload_chunk",
+    "finalize",
+    "homography",
+    "process",
+    "preview_options",
+    "reprocess",
+    "rotate",
+    "download",
+)
+PERCENTILES = (50, 90, 95, 99)
+
+# 与 imaging.COLOR_OPTIONS / GRAYSCALE_OPTIONS 保持一致，远程模式下不导入 imaging
+REPROCESS_OPTIONS = (
+    ("color", "original"),
+    ("color", "enhanced"),
+    ("grayscale", "standard"),
+    ("grayscale", "more"),
+    ("grayscale", "silhouette"),
+    ("color", "adjusted"),
+)
+
+
+# ===== 合成测试图片 =====
+
+
+def make_photo(width, height, seed, quality=90):
+    """
+    生成一张模拟文档照片
+
+    Returns:
+        (JPEG字节, 纸张四个角点 [[x, y], ...])
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+
+    # 低频的桌面背景 + 传感器噪声
+    small = rng.integers(60, 160, size=(8, 8, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    # 稍微倾斜的纸张
+    margin_x, margin_y = width * 0.12, height * 0.1
+    jitter = lambda limit: rng.uniform(-limit, limit)
+    corners = np.array(
+        [
+            [margin_x + jitter(margin_x / 2), margin_y + jitter(margin_y / 2)],
+            [width - margin_x + jitter(margin_x / 2), margin_y + jitter(margin_y / 2)],
+            [
+                width - margin_x + jitter(margin_x / 2),
+                height - margin_y + jitter(margin_y / 2),
+            ],
+            [margin_x + jitter(margin_x / 2), height - margin_y + jitter(margin_y / 2)],
+        ],
+        dtype=np.float32,
+    )
+
+    # 在正视的纸张上画文字行，再透视变换到照片中
+    paper_w, paper_h = int(width * 0.76), int(height * 0.8)
+    paper = np.full((paper_h, paper_w, 3), 235, dtype=np.uint8)
+    line_height = max(paper_h // 40, 8)
+    for y in range(line_height * 2, paper_h - line_height * 2, line_height):
+        x = int(paper_w * 0.08)
+        while x < paper_w * 0.9:
+            word = int(rng.integers(paper_w // 40, paper_w // 12))
+            cv2.rectangle(
+                paper,
+                (x, y),
+                (min(x + word, int(paper_w * 0.92)), y + line_height // 2),
+                (40, 40, 40),
+                -1,
+            )
+            x += word + paper_w // 80
+
+    src = np.array(
+        [[0, 0], [paper_w, 0], [paper_w, paper_h], [0, paper_h]], dtype=np.float32
+    )
+    matrix = cv2.getPerspectiveTransform(src, corners)
+    warped = cv2.warpPerspective(paper, matrix, (width, height))
+    mask = cv2.warpPerspective(
+        np.full((paper_h, paper_w), 255, dtype=np.uint8), matrix, (width, height)
+    )
+    image[mask > 0] = warped[mask > 0]
+
+    # 拍摄时的光照不均和噪声
+    shade = np.linspace(0.8, 1.05, width, dtype=np.float32)[None, :, None]
+    image = np.clip(image * shade + rng.normal(0, 4, image.shape), 0, 255)
+    image = cv2.GaussianBlur(image.astype(np.uint8), (3, 3), 0)
+
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("无法编码测试图片")
+    return buffer.tobytes(), corners.round(1).tolist()
+
+
+# ===== HTTP 客户端 =====
+
+
+class InProcessClient:
+    """通过 Flask test client 直接调用应用（每个线程一个实例）"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def upload(self, filename, data):
+        response = self.client.post(
+            "/upload",
+            data={"file": (io.BytesIO(data), filename)},
+            content_type="multipart/form-data",
+        )
+        return response.status_code, response.get_data()
+
+    def post_json(self, path, payload):
+        response = self.client.post(path, json=payload)
+        return response.status_code, response.get_data()
+
+    def put(self, path, data, headers):
+        response = self.client.put(path, data=data, headers=headers)
+        return response.status_code, response.get_data()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """通过 HTTP 访问运行中的服务器"""
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def upload(self, filename, data):
+        boundary = uuid.uuid4().hex
+        body = b"".join(
+            [
+                f"--{boundary}\r\n".encode(),
+                f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+                b"Content-Type: image/jpeg\r\n\r\n",
+                data,
+                f"\r\n--{boundary}--\r\n".encode(),
+            ]
+        )
+        return self._request(
+            "/upload", body, f"multipart/form-data; boundary={boundary}"
+        )
+
+    def post_json(self, path, payload):
+        body = json.dumps(payload).encode("utf-8")
+        return self._request(path, body, "application/json")
+
+    def put(self, path, data, headers):
+        return self._request(path, data, "application/octet-stream", "PUT", headers)
+
+    def get(self, path):
+        return self._request(path)
+
+    def _request(self, path, body=None, content_type=None, method=None, headers=None):
+        request = urllib.request.Request(
+            self.base_url + path, data=body, method=method, headers=headers or {}
+        )
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ===== 统计 =====
+
+
+class Stats:
+    """线程安全的请求记录"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.error_samples = []
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+
+    def record(self, endpoint, elapsed, ok, detail=None):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(f"{endpoint}: {detail}")
+
+    def session_done(self, ok):
+        with self.lock:
+            if ok:
+                self.sessions_completed += 1
+            else:
+                self.sessions_failed += 1
+
+
+def percentile(sorted_values, pct):
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+# ===== 内存采样 =====
+
+
+def read_rss(pid):
+    """读取进程常驻内存（字节），进程不存在时返回 None"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    return None
+
+
+def child_pids(pid):
+    """列出直接子进程（Gunicorn worker）"""
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as stat:
+                # 进程名可能包含空格，从最后一个 ')' 之后解析
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError, PermissionError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(name))
+    return children
+
+
+class MemorySampler(threading.Thread):
+    """定期采样主进程及其 worker 的内存，记录每个进程的峰值"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+        self.sample()
+
+    def sample(self):
+        for pid in [self.pid] + child_pids(self.pid):
+            rss = read_rss(pid)
+            if rss is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0), rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+# ===== 会话 =====
+
+
+def run_session(client, photo, options, stats):
+    """执行一个完整的用户会话，返回是否全部成功"""
+    data, corners = photo
+
+    def call(endpoint, func, *args):
+        start = time.perf_counter()
+        try:
+            status, body = func(*args)
+        except Exception as e:
+            stats.record(endpoint, time.perf_counter() - start, False, repr(e))
+            return None
+        elapsed = time.perf_counter() - start
+
+        if not 200 <= status < 300:
+            try:
+                detail = json.loads(body).get("error")
+            except ValueError:
+                detail = body[:200]
+            stats.record(endpoint, elapsed, False, f"HTTP {status} {detail}")
+            return None
+        if endpoint == "download":
+            stats.record(endpoint, elapsed, True)
+            return body
+
+        result = json.loads(body)
+        if not result.get("success"):
+            stats.record(endpoint, elapsed, False, result.get("error"))
+            return None
+        stats.record(endpoint, elapsed, True)
+        return result
+
+    if options["chunked"]:
+        uploaded = upload_in_chunks(client, data, call)
+    else:
+        uploaded = call("upload", client.upload, "photo.jpg", data)
+    if uploaded is None:
+        return False
+    filename = uploaded["filename"]
+    alpha_filename = uploaded.get("alpha_filename")
+
+    # 放好第四个角点及之后每次拖动结束时，前端请求一次透视变换
+    for _ in range(options["homography"]):
+        payload = {"corners": corners}
+        if call("homography", client.post_json, "/homography", payload) is None:
+            return False
+
+    processed = call(
+        "process",
+        client.post_json,
+        "/process",
+        {
+            "filename": filename,
+            "corners": corners,
+            "color_mode": "color",
+            "processing_option": "adjusted",
+            "alpha_filename": alpha_filename,
+        },
+    )
+    if processed is None:
+        return False
+    processed_filename = processed["processed_filename"]
+
+    # 前端在每次 /process 成功后加载所有选项的缩略图（包含一次原尺寸透视校正）
+    ok = (
+        call(
+            "preview_options",
+            client.post_json,
+            "/preview_options",
+            {
+                "filename": filename,
+                "corners": corners,
+                "alpha_filename": alpha_filename,
+            },
+        )
+        is not None
+    )
+    for i in range(options["reprocess"]):
+        color_mode, option = REPROCESS_OPTIONS[i % len(REPROCESS_OPTIONS)]
+        ok &= (
+            call(
+                "reprocess",
+                client.post_json,
+                "/reprocess",
+                {
+                    "filename": filename,
+                    "corners": corners,
+                    "color_mode": color_mode,
+                    "processing_option": option,
+                    "processed_filename": processed_filename,
+                    "alpha_filename": alpha_filename,
+                },
+            )
+            is not None
+        )
+        if options["think"]:
+            time.sleep(random.uniform(0, options["think"]))
+
+    for i in range(options["rotate"]):
+        ok &= (
+            call(
+                "rotate",
+                client.post_json,
+                "/rotate",
+                {"filename": processed_filename, "angle": 90 if i % 2 == 0 else -90},
+            )
+            is not None
+        )
+
+    ok &= call("download", client.get, f"/download/{processed_filename}") is not None
+    return ok
+
+
+def upload_in_chunks(client, data, call):
+    """
+    与前端相同地分块上传：创建会话 → 按服务器给出的分块大小依次 PUT → 完成
+
+    Returns:
+        finalize 的响应（与 /upload 相同），失败时返回 None
+    """
+    session = call(
+        "upload",
+        client.post_json,
+        "/upload/sessions",
+        {"filename": "photo.jpg", "size": len(data)},
+    )
+    if session is None:
+        return None
+    path = f"/upload/sessions/{session['upload_id']}"
+
+    chunk_size = session["chunk_size"]
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start : start + chunk_size]
+        headers = {"Content-Range": f"bytes {start}-{start + len(chunk) - 1}/{len(data)}"}
+        if call("upload_chunk", client.put, path, chunk, headers) is None:
+            return None
+
+    return call(
+        "finalize",
+        client.post_json,
+        f"{path}/finalize",
+        {"sha256": hashlib.sha256(data).hexdigest()},
+    )
+
+
+# ===== 服务器 =====
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers, asgi, env):
+    """在临时端口启动 Gunicorn，返回 (进程, 基础URL)"""
+    port = free_port()
+    env = dict(env, HOST="127.0.0.1", PORT=str(port), WORKERS=str(workers))
+    command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py"]
+    if asgi:
+        command += ["-k", "uvicorn_worker.UvicornWorker", "asgi:application"]
+    else:
+        command += ["app:app"]
+
+    process = subprocess.Popen(
+        command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException("Gunicorn 启动失败")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=2).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException("等待 Gunicorn 启动超时")
+
+
+# ===== 报告 =====
+
+
+def build_report(stats, duration, memory_peaks, config):
+    endpoints = {}
+    total_requests = 0
+    total_errors = 0
+    for name in ENDPOINTS:
+        values = sorted(stats.latencies[name])
+        total_requests += len(values)
+        total_errors += stats.errors[name]
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": stats.errors[name],
+            "error_rate": stats.errors[name] / len(values) if values else 0.0,
+            "throughput": len(values) / duration if duration else 0.0,
+            "latency_ms": {
+                **{f"p{p}": percentile(values, p) * 1000 for p in PERCENTILES},
+                "max": (values[-1] * 1000) if values else 0.0,
+            },
+        }
+
+    return {
+        "config": config,
+        "duration": duration,
+        "sessions": {
+            "completed": stats.sessions_completed,
+            "failed": stats.sessions_failed,
+            "throughput": stats.sessions_completed / duration if duration else 0.0,
+        },
+        "requests": {
+            "total": total_requests,
+            "errors": total_errors,
+            "error_rate": total_errors / total_requests if total_requests else 0.0,
+            "throughput": total_requests / duration if duration else 0.0,
+        },
+        "endpoints": endpoints,
+        "memory_peak_bytes": {str(pid): rss for pid, rss in memory_peaks.items()},
+        "error_samples": stats.error_samples,
+    }
+
+
+def print_report(report):
+    sessions = report["sessions"]
+    requests = report["requests"]
+    click.echo("")
+    click.echo(f"耗时: {report['duration']:.1f} 秒")
+    click.echo(
+        f"会话: 完成 {sessions['completed']}，失败 {sessions['failed']}，"
+        f"{sessions['throughput']:.2f} 会话/秒"
+    )
+    click.echo(
+        f"请求: {requests['total']} 个，错误率 {requests['error_rate']:.1%}，"
+        f"{requests['throughput']:.2f} 请求/秒"
+    )
+    click.echo("")
+
+    header = f"{'接口':<16}{'请求':>7}{'错误率':>8}{'请求/秒':>9}"
+    header += "".join(f"{f'p{p}(ms)':>10}" for p in PERCENTILES) + f"{'max(ms)':>10}"
+    click.echo(header)
+    for name, endpoint in report["endpoints"].items():
+        if not endpoint["requests"]:
+            continue
+        latency = endpoint["latency_ms"]
+        line = (
+            f"{name:<16}{endpoint['requests']:>7}{endpoint['error_rate']:>8.1%}"
+            f"{endpoint['throughput']:>9.2f}"
+        )
+        line += "".join(f"{latency[f'p{p}']:>10.0f}" for p in PERCENTILES)
+        line += f"{latency['max']:>10.0f}"
+        click.echo(line)
+
+    if report["memory_peak_bytes"]:
+        click.echo("")
+        click.echo("内存峰值 (RSS):")
+        for pid, rss in report["memory_peak_bytes"].items():
+            click.echo(f"  PID {pid}: {rss / 1024 / 1024:.1f} MB")
+
+    if report["error_samples"]:
+        click.echo("")
+        click.echo("错误示例:")
+        for sample in report["error_samples"]:
+            click.echo(f"  {sample}")
+
+
+# ===== 命令行 =====
+
+
+def parse_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise click.BadParameter("格式应为 宽x高，例如 4000x3000")
+    return width, height
+
+
+@click.command()
+@click.option("--sessions", "-n", default=20, show_default=True, help="模拟会话总数")
+@click.option("--concurrency", "-c", default=4, show_default=True, help="并发会话数")
+@click.option(
+    "--size",
+    default="4000x3000",
+    show_default=True,
+    callback=lambda ctx, param, value: parse_size(value),
+    help="测试图片尺寸（宽x高）",
+)
+@click.option("--images", default=4, show_default=True, help="预先生成的不同图片数量")
+@click.option("--reprocess", default=3, show_default=True, help="每个会话的重新处理次数")
+@click.option("--rotate", default=1, show_default=True, help="每个会话的旋转次数")
+@click.option(
+    "--homography", default=1, show_default=True, help="每个会话的 /homography 请求次数"
+)
+@click.option("--chunked", is_flag=True, help="使用分块上传（浏览器上传大文件时的方式）")
+@click.option("--think", default=0.0, show_default=True, help="重新处理之间的最长随机等待（秒）")
+@click.option("--ramp-up", default=0.0, show_default=True, help="在多少秒内逐步启动并发会话")
+@click.option("--url", help="测试运行中的服务器，例如 http://127.0.0.1:5000/scanimage")
+@click.option("--server-pid", type=int, help="--url 模式下 Gunicorn 主进程PID，用于采样内存")
+@click.option("--gunicorn", "use_gunicorn", is_flag=True, help="启动本地 Gunicorn 进行测试")
+@click.option("--workers", default=2, show_default=True, help="--gunicorn 模式的 worker 数量")
+@click.option("--asgi", is_flag=True, help="--gunicorn 模式使用 ASGI 入口（Uvicorn worker）")
+@click.option("--json", "json_path", type=click.Path(dir_okay=False), help="将结果写入JSON文件")
+def main(
+    sessions,
+    concurrency,
+    size,
+    images,
+    reprocess,
+    rotate,
+    homography,
+    chunked,
+    think,
+    ramp_up,
+    url,
+    server_pid,
+    use_gunicorn,
+    workers,
+    asgi,
+    json_path,
+):
+    """按真实用户流程对应用进行并发压力测试"""
+    if url and use_gunicorn:
+        raise click.UsageError("--url 和 --gunicorn 不能同时使用")
+
+    width, height = size
+    click.echo(f"生成 {images} 张 {width}x{height} 测试图片...")
+    photos = [make_photo(width, height, seed) for seed in range(max(images, 1))]
+    click.echo(f"平均大小: {sum(len(p[0]) for p in photos) / len(photos) / 1024 / 1024:.1f} MB")
+
+    # 进程内和本地 Gunicorn 模式使用临时目录，测试结束后删除
+    workdir = None
+    server = None
+    if not url:
+        workdir = tempfile.mkdtemp(prefix="scanimage-loadtest-")
+        os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+        os.environ["PROCESSED_FOLDER"] = os.path.join(workdir, "processed")
+        os.makedirs(os.environ["UPLOAD_FOLDER"])
+        os.makedirs(os.environ["PROCESSED_FOLDER"])
+
+    try:
+        if use_gunicorn:
+            server, url = start_gunicorn(workers, asgi, os.environ)
+            server_pid = server.pid
+            mode = f"gunicorn ({workers} workers{', asgi' if asgi else ''})"
+            make_client = lambda: HTTPClient(url)
+        elif url:
+            mode = f"http ({url})"
+            make_client = lambda: HTTPClient(url)
+        else:
+            from app import app
+
+            server_pid = os.getpid()
+            mode = "in-process"
+            local = threading.local()
+
+            def make_client():
+                if not hasattr(local, "client"):
+                    local.client = InProcessClient(app)
+                return local.client
+
+        sampler = MemorySampler(server_pid) if server_pid else None
+        if sampler:
+            sampler.start()
+
+        stats = Stats()
+        options = {
+            "reprocess": reprocess,
+            "rotate": rotate,
+            "homography": homography,
+            "chunked": chunked,
+            "think": think,
+        }
+
+        def session(index):
+            # 逐步加压：前 concurrency 个会话在 ramp-up 时间内均匀启动
+            if ramp_up and index < concurrency:
+                time.sleep(ramp_up * index / concurrency)
+            client = make_client()
+            try:
+                ok = run_session(client, photos[index % len(photos)], options, stats)
+            except Exception as e:
+                stats.record("upload", 0.0, False, repr(e))
+                ok = False
+            stats.session_done(ok)
+            done = stats.sessions_completed + stats.sessions_failed
+            if done % max(sessions // 10, 1) == 0:
+                click.echo(f"  已完成 {done}/{sessions} 个会话")
+
+        click.echo(f"模式: {mode}，{sessions} 个会话，并发 {concurrency}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(session, range(sessions)))
+        duration = time.perf_counter() - start
+
+        if sampler:
+            sampler.stop()
+
+        report = build_report(
+            stats,
+            duration,
+            sampler.peaks if sampler else {},
+            {
+                "mode": mode,
+                "sessions": sessions,
+                "concurrency": concurrency,
+                "size": f"{width}x{height}",
+                "reprocess": reprocess,
+                "rotate": rotate,
+                "homography": homography,
+                "chunked": chunked,
+                "think": think,
+            },
+        )
+        print_report(report)
+
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            click.echo(f"\n结果已写入 {json_path}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+可续传的分块上传：创建会话 → 按字节范围 PUT 分块 → 完成（校验后交给常规上传流程）
+
+- 每个会话在共享目录中占一个子目录：session.json 记录文件名、大小和已收到的字节范围，
+  data 是按最终大小预分配的文件，分块直接写入各自的偏移位置
+- 分块可以乱序、重复或并发到达（任意 worker 进程），网络中断后客户端查询已收到的范围，
+  只重传缺失的部分
+- 完成时检查所有字节都已收到，可计算整个文件的 SHA-256 与客户端提供的值比对；
+  完成的结果记录在 session.json 中（数据文件随即删除），丢失响应后重复的完成请求直接得到同一结果
+- 自最后一次访问起超过有效期的会话由 prune() 删除
+
+session.json 同时作为会话的锁文件（见 filelocks），同一会话的分块和完成请求依次更新它。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from filelocks import locked_json
+
+# 计算校验和时每次读取的块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class SessionNotFound(Exception):
+    """上传会话不存在或已过期"""
+
+
+class InvalidChunk(ValueError):
+    """分块的字节范围与会话不符"""
+
+
+class UploadSessions:
+    """
+    分块上传会话的存储：每个会话一个子目录，数据按偏移写入预分配的文件
+
+    Args:
+        folder: 存放会话子目录的目录（所有 worker 共用，应与上传目录在同一文件系统）
+        chunk_size: 建议客户端使用的分块大小（字节）
+        ttl: 会话自最后一次访问起的有效期（秒）
+    """
+
+    def __init__(self, folder, chunk_size=1024 * 1024, ttl=24 * 3600):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+
+    def create(self, filename, size):
+        """创建会话并预分配数据文件，返回会话状态"""
+        self.prune()
+        upload_id = uuid.uuid4().hex
+        session_dir = self._path(upload_id)
+        os.makedirs(session_dir)
+        with open(os.path.join(session_dir, "data"), "wb") as data_file:
+            data_file.truncate(size)
+        state = {
+            "filename": filename,
+            "size": size,
+            "received": [],
+            "created": time.time(),
+        }
+        with open(os.path.join(session_dir, "session.json"), "w") as state_file:
+            json.dump(state, state_file)
+        return self._status(upload_id, state)
+
+    def status(self, upload_id):
+        """返回会话状态（见 _status()）"""
+        with self._locked(upload_id) as state:
+            return self._status(upload_id, state)
+
+    def write(self, upload_id, start, data, total=None):
+        """
+        写入从 start 开始的分块并记录已收到的范围
+
+        Args:
+            upload_id: 会话ID
+            start: 分块在文件中的起始偏移
+            data: 分块内容
+            total: Content-Range 中声明的文件总大小（可选，用于核对）
+
+        Returns:
+            写入后的会话状态
+        """
+        with self._locked(upload_id) as state:
+            if "result" in state:
+                raise InvalidChunk("上传已完成")
+            size = state["size"]
+            end = start + len(data)
+            if total is not None and total != size:
+                raise InvalidChunk(f"文件大小不符：会话为 {size} 字节")
+            if start < 0 or not data or end > size:
+                raise InvalidChunk(f"字节范围超出文件大小 {size}")
+
+            with open(os.path.join(self._path(upload_id), "data"), "r+b") as data_file:
+                data_file.seek(start)
+                data_file.write(data)
+
+            state["received"] = _merge_ranges(state["received"] + [[start, end]])
+            return self._status(upload_id, state)
+
+    @contextmanager
+    def finalize(self, upload_id):
+        """
+        锁定已收齐的会话，产出 CompletedUpload
+
+        锁定期间同一会话的其他完成请求等待，之后得到记录的结果，不会重复处理；
+        会话未收齐时抛出 InvalidChunk
+        """
+        with self._locked(upload_id) as state:
+            if "result" not in state and state["received"] != [[0, state["size"]]]:
+                raise InvalidChunk("文件尚未上传完整")
+            yield CompletedUpload(self._path(upload_id), state)
+
+    def prune(self):
+        """删除超过有效期的会话，返回删除的字节数"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return removed
+        for name in names:
+            session_dir = self._path(name)
+            data_path = os.path.join(session_dir, "data")
+            try:
+                # 创建到一半的会话没有 session.json，按目录本身的时间判断
+                state_path = os.path.join(session_dir, "session.json")
+                if not os.path.exists(state_path):
+                    state_path = session_dir
+                if os.path.getmtime(state_path) >= cutoff:
+                    continue
+                if os.path.exists(data_path):
+                    removed += os.path.getsize(data_path)
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(session_dir, ignore_errors=True)
+        return removed
+
+    def _status(self, upload_id, state):
+        """会话状态：已收到的范围为 [起始, 结束) 字节偏移的列表"""
+        received = state["received"]
+        return {
+            "upload_id": upload_id,
+            "filename": state["filename"],
+            "size": state["size"],
+            "chunk_size": self.chunk_size,
+            "received": received,
+            "complete": received == [[0, state["size"]]],
+            "finalized": "result" in state,
+        }
+
+    def _path(self, upload_id):
+        return os.path.join(self.folder, upload_id)
+
+    @contextmanager
+    def _locked(self, upload_id):
+        """在会话文件锁内读取状态，退出时写回（同时刷新会话的有效期）"""
+        if not _SESSION_ID.match(upload_id):
+            raise SessionNotFound(upload_id)
+        state_path = os.path.join(self._path(upload_id), "session.json")
+        with ExitStack() as stack:
+            try:
+                state = stack.enter_context(locked_json(state_path, create=False))
+            except FileNotFoundError:
+                # 会话不存在，或等待锁期间已被删除
+                raise SessionNotFound(upload_id) from None
+            yield state
+
+
+class CompletedUpload:
+    """
+    finalize() 锁定的已收齐会话
+
+    Attributes:
+        data_path: 组装好的文件
+        filename: 客户端提供的原始文件名
+        result: 之前完成时记录的 {"status", "body"}，尚未完成时为 None
+    """
+
+    def __init__(self, session_dir, state):
+        self.data_path = os.path.join(session_dir, "data")
+        self.filename = state["filename"]
+        self.result = state.get("result")
+        self._state = state
+
+    def sha256(self):
+        """整个文件的 SHA-256（十六进制）"""
+        return _file_sha256(self.data_path)
+
+    def record(self, status, body):
+        """记录完成的结果并删除数据文件，之后重复的完成请求直接返回该结果"""
+        self._state["result"] = {"status": status, "body": body}
+        self.result = self._state["result"]
+        try:
+            os.remove(self.data_path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_content_range(header):
+    """
+    解析 "bytes start-end/total" 形式的 Content-Range
+
+    Returns:
+        (start, end, total)，end 为包含的最后一个字节；total 为 "*" 时为 None
+    """
+    match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+|\*)", (header or "").strip())
+    if not match:
+        raise InvalidChunk("缺少或无效的 Content-Range")
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if end < start:
+        raise InvalidChunk("缺少或无效的 Content-Range")
+    return start, end, total
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        while True:
+            block = data_file.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,142 @@
+"""
+跨 worker 的相同请求合并（single-flight）与过期请求取消
+
+- 参数完全相同的并发请求只计算一次：先拿到文件锁的请求负责计算，并把结果写入共享目录；
+  其余请求（无论在哪个 worker 进程或线程中）等待锁释放后直接读取该结果
+- 同一个结果文件（processed_filename）的新请求会使旧请求失效，
+  旧请求在检查点处放弃，不会再计算或覆盖较新的结果
+
+每个合并键对应共享目录中的一个锁文件（见 filelocks），结果文件通过原子重命名发布。
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from filelocks import locked
+
+
+class Superseded(Exception):
+    """请求已被针对同一结果文件的更新请求取代"""
+
+
+class SingleFlight:
+    """
+    基于目录的请求合并注册表
+
+    Args:
+        folder: 存放锁文件、共享结果和请求令牌的目录（所有 worker 共用）
+        window: 共享结果的有效时间（秒），超过后相同请求会重新计算
+    """
+
+    def __init__(self, folder, window=30):
+        self.folder = folder
+        self.window = window
+
+    @staticmethod
+    def key(**params):
+        """根据请求参数生成合并键"""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def run(self, key, compute, checkpoint=None):
+        """
+        执行或等待相同键的计算
+
+        Args:
+            key: 合并键（见 key()）
+            compute: 无参函数，返回结果字节；返回 None 表示失败且不共享
+            checkpoint: 可选的无参函数，在真正开始计算前调用（可抛出 Superseded）
+
+        Returns:
+            结果字节，或 compute() 返回的 None
+        """
+        result_path = self._path(f"{key}.result")
+        with self._locked(f"{key}.lock"):
+            if checkpoint:
+                checkpoint()
+
+            # 等待期间其他请求可能已经算好了
+            cached = self._read_fresh(result_path)
+            if cached is not None:
+                return cached
+
+            data = compute()
+            if data is not None:
+                self._write_atomic(result_path, data)
+                self.prune()
+            return data
+
+    def claim(self, target):
+        """登记针对 target 的最新请求，使之前的请求失效，返回本请求的令牌"""
+        token = uuid.uuid4().hex
+        self._write_atomic(self._token_path(target), token.encode("ascii"))
+        return token
+
+    def check(self, target, token):
+        """如果已有针对 target 的更新请求，抛出 Superseded"""
+        try:
+            with open(self._token_path(target), "rb") as token_file:
+                current = token_file.read().decode("ascii")
+        except FileNotFoundError:
+            return
+        if current != token:
+            raise Superseded(target)
+
+    def commit(self, target, token, write):
+        """确认本请求仍是最新的之后调用 write()，检查和写入在同一把锁内完成"""
+        with self._locked(f"{self._target_id(target)}.commit.lock"):
+            self.check(target, token)
+            write()
+
+    def prune(self):
+        """删除早已过期的共享结果，避免与 processed/ 中的文件重复占用磁盘"""
+        cutoff = time.time() - 2 * self.window
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".result"):
+                continue
+            path = self._path(name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    @staticmethod
+    def _target_id(target):
+        return hashlib.sha1(target.encode("utf-8")).hexdigest()
+
+    def _token_path(self, target):
+        return self._path(f"{self._target_id(target)}.token")
+
+    @contextmanager
+    def _locked(self, name):
+        os.makedirs(self.folder, exist_ok=True)
+        with locked(self._path(name)):
+            yield
+
+    def _read_fresh(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.window:
+                return None
+            with open(path, "rb") as result_file:
+                return result_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_atomic(self, path, data):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# 异步模式启动脚本（ASGI，慢速上传/下载不占用图像处理线程）
+# 使用方法: ./start_async.sh
+
+echo "Starting ScanImage application (Async)..."
+
+# 检查 .env 文件是否存在
+if [ ! -f .env ]; then
+    echo "No .env file found, copying .env.example as .env"
+    cp .env.example .env
+    echo "Please edit .env file to configure your application"
+    exit 1
+fi
+
+# 加载环境变量
+set -a
+source .env
+set +a
+
+# 显示配置信息
+echo "Configuration:"
+echo "- Loading environment from .env file"
+echo "- Workers: ${WORKERS:-2}, compute threads per worker: ${COMPUTE_WORKERS:-CPU count}"
+echo ""
+
+# 创建必要的目录
+mkdir -p logs uploads processed
+
+# 启动Gunicorn（Uvicorn worker）
+echo "Starting Gunicorn server with Uvicorn workers..."
+gunicorn -k uvicorn_worker.UvicornWorker \
+    -w "${WORKERS:-2}" \
+    -b "${HOST:-127.0.0.1}:${PORT:-5000}" \
+    asgi:application
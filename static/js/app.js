@@ -43,6 +43,15 @@ let magnifierCtx = null;
 let magnifierZoom = 3; // 放大倍数
 let magnifierSize = 150; // 放大镜尺寸（像素）
 let magnifierOffset = 30; // 放大镜与光标的距离
+let tileCache = new Map(); // 已加载的放大镜瓦片，key: level/x/y
+let lastMagnifierEvent = null; // 瓦片加载完成后用于重绘放大镜
+
+// 透视校正实时预览相关变量
+let warpPreview = null;
+let warpPreviewCanvas = null;
+let warpPreviewCtx = null;
+let warpPreviewMaxSize = 240; // 预览最长边（像素）
+let homographyRequestId = 0; // 只采用最新一次 /homography 请求的结果
 
 // API路径辅助函数
 function getApiUrl(path) {
@@ -159,6 +168,11 @@ function initializeElements() {
     // 初始化放大镜
     initializeMagnifier();
 
+    // 透视校正实时预览
+    warpPreview = document.getElementById('warp-preview');
+    warpPreviewCanvas = document.getElementById('warp-preview-canvas');
+    warpPreviewCtx = warpPreviewCanvas.getContext('2d');
+
     // 添加调试信息显示
     if (debugMode) {
         createDebugInfoDisplay();
@@ -260,6 +274,10 @@ function updateMagnifier(event) {
         }
     }
 
+    // 用高分辨率瓦片覆盖预览图的放大结果（未加载的瓦片先显示预览图）
+    lastMagnifierEvent = event;
+    drawMagnifierTiles(canvasX, canvasY, sourceSize);
+
     // 智能定位放大镜，避免遮挡当前位置
     positionMagnifier(event, rect);
 
@@ -267,6 +285,102 @@ function updateMagnifier(event) {
     magnifier.style.display = 'block';
 }
 
+// 选择放大镜使用的金字塔级别：分辨率不低于放大后显示所需的最低一级
+function selectTileLevel(sourceSize) {
+    const pyramid = savedState.pyramid;
+    if (!pyramid || pyramid.levels.length === 0) {
+        return null;
+    }
+
+    // 放大后每个显示像素至少对应一个瓦片像素
+    const requiredWidth = canvas.width * magnifierSize / sourceSize;
+    for (const level of pyramid.levels) {
+        if (level.width >= requiredWidth) {
+            return level;
+        }
+    }
+    return pyramid.levels[pyramid.levels.length - 1];
+}
+
+// 获取瓦片，未加载时发起请求并在加载后重绘放大镜
+function getTile(level, x, y) {
+    const key = `${level}/${x}/${y}`;
+    let tile = tileCache.get(key);
+    if (!tile) {
+        tile = new Image();
+        tile.onload = function () {
+            if (lastMagnifierEvent && magnifier && magnifier.style.display === 'block') {
+                updateMagnifier(lastMagnifierEvent);
+            }
+        };
+        tile.src = getApiUrl(`/tiles/${encodeURIComponent(uploadedFilename)}/${level}/${x}_${y}.jpg`);
+        tileCache.set(key, tile);
+    }
+    return tile;
+}
+
+// 在放大镜中绘制光标附近的高分辨率瓦片
+function drawMagnifierTiles(canvasX, canvasY, sourceSize) {
+    const level = selectTileLevel(sourceSize);
+    if (!level) {
+        return;
+    }
+
+    const tileSize = savedState.pyramid.tile_size;
+    const levelScale = level.width / canvas.width;
+
+    // 放大镜显示区域在该级别中的像素范围
+    const regionSize = sourceSize * levelScale;
+    const regionX = canvasX * levelScale - regionSize / 2;
+    const regionY = canvasY * levelScale - regionSize / 2;
+    const ratio = magnifierSize / regionSize;
+
+    const firstCol = Math.max(0, Math.floor(regionX / tileSize));
+    const lastCol = Math.min(level.cols - 1, Math.floor((regionX + regionSize) / tileSize));
+    const firstRow = Math.max(0, Math.floor(regionY / tileSize));
+    const lastRow = Math.min(level.rows - 1, Math.floor((regionY + regionSize) / tileSize));
+
+    for (let y = firstRow; y <= lastRow; y++) {
+        for (let x = firstCol; x <= lastCol; x++) {
+            const tile = getTile(level.level, x, y);
+            if (!tile.complete || tile.naturalWidth === 0) {
+                continue;
+            }
+            magnifierCtx.drawImage(
+                tile,
+                (x * tileSize - regionX) * ratio,
+                (y * tileSize - regionY) * ratio,
+                tile.naturalWidth * ratio,
+                tile.naturalHeight * ratio
+            );
+        }
+    }
+
+    // 瓦片会覆盖canvas上的选择框，在放大镜中重新绘制
+    if (corners.length >= 2) {
+        const zoom = magnifierSize / sourceSize;
+        const originX = canvasX - sourceSize / 2;
+        const originY = canvasY - sourceSize / 2;
+
+        magnifierCtx.strokeStyle = '#007bff';
+        magnifierCtx.lineWidth = 2;
+        magnifierCtx.beginPath();
+        corners.forEach((corner, index) => {
+            const x = (corner[0] - originX) * zoom;
+            const y = (corner[1] - originY) * zoom;
+            if (index === 0) {
+                magnifierCtx.moveTo(x, y);
+            } else {
+                magnifierCtx.lineTo(x, y);
+            }
+        });
+        if (corners.length === 4) {
+            magnifierCtx.closePath();
+        }
+        magnifierCtx.stroke();
+    }
+}
+
 // 智能定位放大镜
 function positionMagnifier(event, rect) {
     // 获取事件的客户端坐标
@@ -313,6 +427,7 @@ function hideMagnifier() {
     if (magnifier) {
         magnifier.style.display = 'none';
     }
+    lastMagnifierEvent = null;
 }
 
 function setupEventListeners() {
@@ -427,24 +542,30 @@ async function handleFileUpload(event) {
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     // 添加扩图选项
     const expandImageCheckbox = document.getElementById('expand-image');
-    if (expandImageCheckbox && expandImageCheckbox.checked) {
-        formData.append('expandImage', 'on');
-    }
+    const expandImage = Boolean(expandImageCheckbox && expandImageCheckbox.checked);
 
     showLoading(true);
 
     try {
-        const response = await fetch(getApiUrl('/upload'), {
-            method: 'POST',
-            body: formData
-        });
+        let result;
+        if (window.UPLOAD_CHUNK_SIZE && file.size > window.UPLOAD_CHUNK_SIZE) {
+            // 大文件分块上传，网络中断后只重传缺失的分块
+            result = await uploadInChunks(file, expandImage);
+        } else {
+            const formData = new FormData();
+            formData.append('file', file);
+            if (expandImage) {
+                formData.append('expandImage', 'on');
+            }
 
-        const result = await response.json();
+            const response = await fetch(getApiUrl('/upload'), {
+                method: 'POST',
+                body: formData
+            });
+            result = await response.json();
+        }
 
         if (result.success) {
             uploadedFilename = result.filename;
@@ -456,10 +577,15 @@ async function handleFileUpload(event) {
             savedState.filename = result.filename;
             savedState.hasAlpha = result.has_alpha || false;
             savedState.alphaFilename = result.alpha_filename || null;
+            savedState.imageType = result.image_type || 'image/png';
+            savedState.imageWidth = result.width || null;   // 原图尺寸，用于换算角点坐标
+            savedState.imageHeight = result.height || null;
+            savedState.pyramid = result.pyramid || null;    // 放大镜使用的瓦片金字塔
             savedState.cropCorners = []; // 重置裁剪区域
             savedState.actualCorners = []; // 重置实际坐标
+            tileCache.clear();
 
-            displayImageForSelection(result.image_data);
+            displayImageForSelection(result.image_data, savedState.imageType);
             showSection('selection-section');
         } else {
             showError(result.error || '上传失败');
@@ -471,7 +597,158 @@ async function handleFileUpload(event) {
     }
 }
 
-function displayImageForSelection(imageData) {
+// 分块上传：每个请求（创建会话、分块、完成）的最多尝试次数
+const UPLOAD_ATTEMPTS = 5;
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+// 网络错误和 5xx 响应按指数退避重试；503 按服务器给出的 Retry-After 等待
+async function fetchWithRetry(url, options = {}) {
+    for (let attempt = 1; ; attempt++) {
+        let delay = Math.min(1000 * 2 ** (attempt - 1), 8000);
+        try {
+            const response = await fetch(url, options);
+            if (response.status < 500 || attempt >= UPLOAD_ATTEMPTS) {
+                return response;
+            }
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+            if (retryAfter > 0) {
+                delay = retryAfter * 1000;
+            }
+        } catch (error) {
+            if (attempt >= UPLOAD_ATTEMPTS) {
+                throw error;
+            }
+        }
+        await sleep(delay);
+    }
+}
+
+// 同一文件（名称、大小、修改时间相同）的会话ID保存在 localStorage，刷新页面后也能续传
+function uploadSessionKey(file) {
+    return `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+function loadUploadSession(file) {
+    try {
+        return localStorage.getItem(uploadSessionKey(file));
+    } catch (error) {
+        return null;
+    }
+}
+
+function saveUploadSession(file, uploadId) {
+    try {
+        if (uploadId) {
+            localStorage.setItem(uploadSessionKey(file), uploadId);
+        } else {
+            localStorage.removeItem(uploadSessionKey(file));
+        }
+    } catch (error) {
+        // 隐私模式等禁用存储时只在本页内续传
+    }
+}
+
+// 整个文件的 SHA-256（十六进制）；crypto.subtle 仅在 HTTPS 或 localhost 下可用，
+// 不可用时返回 null，服务器只检查是否收齐所有字节
+async function fileSha256(file) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// 继续已有的上传会话，或创建新会话
+async function openUploadSession(file) {
+    const savedId = loadUploadSession(file);
+    if (savedId) {
+        const response = await fetchWithRetry(getApiUrl(`/upload/sessions/${savedId}`));
+        if (response.ok) {
+            return response.json();
+        }
+        saveUploadSession(file, null);
+    }
+
+    const response = await fetchWithRetry(getApiUrl('/upload/sessions'), {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const session = await response.json();
+    if (!session.success) {
+        throw new Error(session.error || '上传失败');
+    }
+    saveUploadSession(file, session.upload_id);
+    return session;
+}
+
+// 按分块大小切分尚未收到的字节范围（received 为已收到的 [起始, 结束) 列表）
+function missingChunks(received, size, chunkSize) {
+    const chunks = [];
+    let position = 0;
+    for (const [start, end] of [...received, [size, size]]) {
+        for (let offset = position; offset < start; offset += chunkSize) {
+            chunks.push([offset, Math.min(offset + chunkSize, start)]);
+        }
+        position = Math.max(position, end);
+    }
+    return chunks;
+}
+
+async function uploadInChunks(file, expandImage) {
+    // 校验和与分块上传同时计算
+    const sha256Promise = fileSha256(file).catch(() => null);
+    const session = await openUploadSession(file);
+    const url = getApiUrl(`/upload/sessions/${session.upload_id}`);
+
+    const chunks = missingChunks(session.received, file.size, session.chunk_size);
+    let sent = file.size - chunks.reduce((total, [start, end]) => total + end - start, 0);
+    for (const [start, end] of chunks) {
+        setLoadingMessage(`正在上传 ${Math.floor((sent / file.size) * 100)}%...`);
+        let response;
+        try {
+            response = await fetchWithRetry(url, {
+                method: 'PUT',
+                headers: { 'Content-Range': `bytes ${start}-${end - 1}/${file.size}` },
+                body: file.slice(start, end)
+            });
+        } catch (error) {
+            throw new Error('网络中断，再次点击上传将从中断处继续');
+        }
+        const result = await response.json();
+        if (!result.success) {
+            if (response.status === 404) {
+                saveUploadSession(file, null);
+            }
+            throw new Error(result.error || '上传失败');
+        }
+        sent += end - start;
+    }
+
+    setLoadingMessage(null);
+    const sha256 = await sha256Promise;
+    let response;
+    try {
+        // 完成请求可以重复发送：响应丢失后重试会得到服务器记录的同一结果
+        response = await fetchWithRetry(`${url}/finalize`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sha256, expandImage })
+        });
+    } catch (error) {
+        throw new Error('网络中断，再次点击上传将从中断处继续');
+    }
+    // 服务器繁忙时保留会话，稍后再次点击上传只需重新完成
+    if (response.status !== 503) {
+        saveUploadSession(file, null);
+    }
+    return response.json();
+}
+
+function displayImageForSelection(imageData, imageType = 'image/png') {
     // 保存原始图片数据以供后续使用
     window.originalImageBase64 = imageData;
 
@@ -506,7 +783,226 @@ function displayImageForSelection(imageData) {
         // 初始化四个角点
         initializeCorners();
     };
-    img.src = 'data:image/png;base64,' + imageData;
+    img.src = `data:${imageType};base64,` + imageData;
+}
+
+// 将canvas上的角点换算为原图坐标
+function getActualCorners() {
+    // 服务器返回的是预览图，按原图尺寸换算；旧数据没有尺寸时退回预览图尺寸
+    const imageWidth = savedState.imageWidth || canvas.width;
+    const imageHeight = savedState.imageHeight || canvas.height;
+    const scaleX = imageWidth / canvas.width;
+    const scaleY = imageHeight / canvas.height;
+
+    return corners.map(corner => [
+        corner[0] * scaleX,
+        corner[1] * scaleY
+    ]);
+}
+
+// ===== 透视校正实时预览 =====
+// 拖拽时在本地按与服务器相同的规则计算透视变换并绘制预览；角点确定后向 /homography
+// 获取服务器的变换矩阵和输出尺寸，只有点击处理时才调用 /process
+
+// 角点排序（与 imaging.perspective_transform 一致）：按Y重心分为上下两组，
+// 再按X排成左上、右上、右下、左下；分组失败时保持原顺序
+function orderCorners(points) {
+    const centerY = points.reduce((sum, p) => sum + p[1], 0) / points.length;
+    const top = points.filter(p => p[1] < centerY);
+    const bottom = points.filter(p => p[1] >= centerY);
+
+    if (top.length !== 2 || bottom.length !== 2) {
+        return points.slice();
+    }
+
+    top.sort((a, b) => a[0] - b[0]);
+    bottom.sort((a, b) => a[0] - b[0]);
+    return [top[0], top[1], bottom[1], bottom[0]];
+}
+
+// 求解把 src 四点映射到 dst 四点的3x3透视变换矩阵（同 cv2.getPerspectiveTransform）
+function solveHomography(src, dst) {
+    const rows = [];
+    for (let i = 0; i < 4; i++) {
+        const [x, y] = src[i];
+        const [u, v] = dst[i];
+        rows.push([x, y, 1, 0, 0, 0, -x * u, -y * u, u]);
+        rows.push([0, 0, 0, x, y, 1, -x * v, -y * v, v]);
+    }
+
+    // 部分主元高斯消元
+    for (let col = 0; col < 8; col++) {
+        let pivot = col;
+        for (let r = col + 1; r < 8; r++) {
+            if (Math.abs(rows[r][col]) > Math.abs(rows[pivot][col])) {
+                pivot = r;
+            }
+        }
+        if (Math.abs(rows[pivot][col]) < 1e-12) {
+            return null;
+        }
+        [rows[col], rows[pivot]] = [rows[pivot], rows[col]];
+
+        for (let r = 0; r < 8; r++) {
+            if (r === col) {
+                continue;
+            }
+            const factor = rows[r][col] / rows[col][col];
+            for (let c = col; c < 9; c++) {
+                rows[r][c] -= factor * rows[col][c];
+            }
+        }
+    }
+
+    const h = rows.map((row, i) => row[8] / row[i]);
+    return [
+        [h[0], h[1], h[2]],
+        [h[3], h[4], h[5]],
+        [h[6], h[7], 1]
+    ];
+}
+
+// 本地计算透视变换和输出尺寸（与 imaging.perspective_transform 相同的规则）
+function computePerspectiveTransform(points) {
+    const ordered = orderCorners(points);
+    const distance = (a, b) => Math.hypot(a[0] - b[0], a[1] - b[1]);
+
+    const width = Math.trunc((distance(ordered[1], ordered[0]) + distance(ordered[2], ordered[3])) / 2);
+    const height = Math.trunc((distance(ordered[3], ordered[0]) + distance(ordered[2], ordered[1])) / 2);
+    if (width <= 0 || height <= 0) {
+        return null;
+    }
+
+    const matrix = solveHomography(ordered, [[0, 0], [width, 0], [width, height], [0, height]]);
+    return matrix ? { matrix, width, height } : null;
+}
+
+function invertMatrix3(m) {
+    const [[a, b, c], [d, e, f], [g, h, i]] = m;
+    const A = e * i - f * h;
+    const B = f * g - d * i;
+    const C = d * h - e * g;
+    const det = a * A + b * B + c * C;
+    if (Math.abs(det) < 1e-12) {
+        return null;
+    }
+    return [
+        [A / det, (c * h - b * i) / det, (b * f - c * e) / det],
+        [B / det, (a * i - c * g) / det, (c * d - a * f) / det],
+        [C / det, (b * g - a * h) / det, (a * e - b * d) / det]
+    ];
+}
+
+function hideWarpPreview() {
+    homographyRequestId++; // 丢弃尚未返回的 /homography 结果
+    if (warpPreview) {
+        warpPreview.classList.add('d-none');
+    }
+}
+
+// 绘制预览：transform.matrix 把原图坐标映射到输出坐标，从canvas上的预览图反向采样
+function renderWarpPreview(transform) {
+    if (!originalImageData || !warpPreviewCtx) {
+        return;
+    }
+
+    const inverse = invertMatrix3(transform.matrix);
+    if (!inverse) {
+        hideWarpPreview();
+        return;
+    }
+
+    // 原图坐标 → canvas坐标的缩放
+    const toCanvasX = canvas.width / (savedState.imageWidth || canvas.width);
+    const toCanvasY = canvas.height / (savedState.imageHeight || canvas.height);
+
+    const scale = Math.min(warpPreviewMaxSize / transform.width, warpPreviewMaxSize / transform.height);
+    const previewWidth = Math.max(1, Math.round(transform.width * scale));
+    const previewHeight = Math.max(1, Math.round(transform.height * scale));
+    warpPreviewCanvas.width = previewWidth;
+    warpPreviewCanvas.height = previewHeight;
+
+    const source = originalImageData.data;
+    const sourceWidth = originalImageData.width;
+    const sourceHeight = originalImageData.height;
+    const output = warpPreviewCtx.createImageData(previewWidth, previewHeight);
+    const target = output.data;
+
+    for (let py = 0; py < previewHeight; py++) {
+        const v = (py + 0.5) / scale;
+        for (let px = 0; px < previewWidth; px++) {
+            const u = (px + 0.5) / scale;
+            const w = inverse[2][0] * u + inverse[2][1] * v + inverse[2][2];
+            const sx = Math.floor((inverse[0][0] * u + inverse[0][1] * v + inverse[0][2]) / w * toCanvasX);
+            const sy = Math.floor((inverse[1][0] * u + inverse[1][1] * v + inverse[1][2]) / w * toCanvasY);
+
+            const t = (py * previewWidth + px) * 4;
+            if (sx >= 0 && sy >= 0 && sx < sourceWidth && sy < sourceHeight) {
+                const s = (sy * sourceWidth + sx) * 4;
+                target[t] = source[s];
+                target[t + 1] = source[s + 1];
+                target[t + 2] = source[s + 2];
+            } else {
+                target[t] = target[t + 1] = target[t + 2] = 255;
+            }
+            target[t + 3] = 255;
+        }
+    }
+
+    warpPreviewCtx.putImageData(output, 0, 0);
+    document.getElementById('warp-preview-size').textContent =
+        `${transform.width} × ${transform.height}`;
+    warpPreview.classList.remove('d-none');
+}
+
+// 角点变化时（拖拽中每帧）更新本地预览
+function updateWarpPreview() {
+    if (corners.length !== 4) {
+        hideWarpPreview();
+        return;
+    }
+
+    homographyRequestId++; // 角点已变化，之前的 /homography 结果作废
+    const transform = computePerspectiveTransform(getActualCorners());
+    if (transform) {
+        renderWarpPreview(transform);
+    } else {
+        hideWarpPreview();
+    }
+}
+
+// 角点确定后使用服务器计算的变换矩阵和输出尺寸
+async function settleWarpPreview() {
+    if (corners.length !== 4) {
+        return;
+    }
+
+    const requestId = ++homographyRequestId;
+    try {
+        const response = await fetch(getApiUrl('/homography'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ corners: getActualCorners() })
+        });
+        const result = await response.json();
+
+        // 请求期间角点又发生了变化，忽略过期结果
+        if (requestId !== homographyRequestId) {
+            return;
+        }
+        if (result.success) {
+            renderWarpPreview(result);
+        } else {
+            hideWarpPreview();
+        }
+    } catch (error) {
+        // 保留本地预览
+        if (debugMode) {
+            console.log('获取透视变换失败:', error);
+        }
+    }
 }
 
 function initializeCorners() {
@@ -517,6 +1013,7 @@ function initializeCorners() {
     const existingPoints = canvasContainer.querySelectorAll('.corner-point');
     existingPoints.forEach(point => point.remove());
 
+    hideWarpPreview();
     updateProcessButton();
 }
 
@@ -662,6 +1159,7 @@ function handleCanvasMouseDown(event) {
         updateCornerPoints();
         drawSelection();
         updateProcessButton();
+        settleWarpPreview();
 
         if (debugMode) {
             console.log(`添加新角点: (${x}, ${y}), 总数: ${corners.length}`);
@@ -753,6 +1251,7 @@ function handleMouseUp(event) {
             // 更新最终位置
             updateCornerPoints();
             drawSelection();
+            settleWarpPreview();
 
             if (debugMode) {
                 console.log(`拖拽结束: 角点${dragIndex} 最终位置 (${clampedX}, ${clampedY})`);
@@ -929,6 +1428,8 @@ function drawSelection() {
             ctx.setLineDash([]);
         }
     }
+
+    updateWarpPreview();
 }
 
 function resetSelection() {
@@ -945,6 +1446,7 @@ function resetSelection() {
         ctx.putImageData(originalImageData, 0, 0);
     }
 
+    hideWarpPreview();
     updateProcessButton();
 }
 
@@ -1026,6 +1528,7 @@ async function processImage() {
                 displayProcessedImage(result.image_data);
                 setupProcessingOptions(colorMode);
                 showSection('result-section');
+                loadOptionPreviews();
             } else {
                 showError(result.error || '处理失败');
             }
@@ -1037,59 +1540,46 @@ async function processImage() {
         return;
     }
 
-    // 有4个角点的情况，原有逻辑
-    // 直接使用canvas的尺寸和原始图片的尺寸计算缩放比例
-    // 这里需要从displayImageForSelection函数获取原始图片尺寸
-    const img = new Image();
-    img.onload = async function () {
-        const scaleX = img.naturalWidth / canvas.width;
-        const scaleY = img.naturalHeight / canvas.height;
-
-        const actualCorners = corners.map(corner => [
-            corner[0] * scaleX,
-            corner[1] * scaleY
-        ]);
+    // 有4个角点的情况：按原图尺寸换算角点坐标
+    const actualCorners = getActualCorners();
 
-        // 保存实际坐标（原始图片尺寸）用于重新处理
-        savedState.actualCorners = actualCorners;
+    // 保存实际坐标（原始图片尺寸）用于重新处理
+    savedState.actualCorners = actualCorners;
 
-        showLoading(true);
+    showLoading(true);
 
-        try {
-            const response = await fetch(getApiUrl('/process'), {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    filename: uploadedFilename,
-                    corners: actualCorners,
-                    color_mode: colorMode,
-                    processing_option: 'adjusted',
-                    alpha_filename: savedState.alphaFilename // 传递Alpha通道文件名
-                })
-            });
+    try {
+        const response = await fetch(getApiUrl('/process'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                filename: uploadedFilename,
+                corners: actualCorners,
+                color_mode: colorMode,
+                processing_option: 'adjusted',
+                alpha_filename: savedState.alphaFilename // 传递Alpha通道文件名
+            })
+        });
 
-            const result = await response.json();
+        const result = await response.json();
 
-            if (result.success) {
-                processedFilename = result.processed_filename;
-                currentProcessingOption = 'adjusted';
-                displayProcessedImage(result.image_data);
-                setupProcessingOptions(colorMode);
-                showSection('result-section');
-            } else {
-                showError(result.error || '处理失败');
-            }
-        } catch (error) {
-            showError('处理失败: ' + error.message);
-        } finally {
-            showLoading(false);
+        if (result.success) {
+            processedFilename = result.processed_filename;
+            currentProcessingOption = 'adjusted';
+            displayProcessedImage(result.image_data);
+            setupProcessingOptions(colorMode);
+            showSection('result-section');
+            loadOptionPreviews();
+        } else {
+            showError(result.error || '处理失败');
         }
-    };
-
-    // 重新加载原始图片以获取正确的尺寸
-    img.src = 'data:image/png;base64,' + window.originalImageBase64;
+    } catch (error) {
+        showError('处理失败: ' + error.message);
+    } finally {
+        showLoading(false);
+    }
 }
 
 function setupProcessingOptions(colorMode) {
@@ -1116,6 +1606,7 @@ function setupProcessingOptions(colorMode) {
 
     // 更新色彩模式切换按钮状态
     updateColorModeButtons(colorMode);
+    updateOptionPreviewSelection();
 }
 
 // 更新灰度处理选项描述
@@ -1154,56 +1645,158 @@ async function reprocessImage() {
         processingOption = selectedOption ? selectedOption.value : 'standard';
     }
 
-    // 重新加载原始图片以计算尺寸
-    const img = new Image();
-    img.onload = async function () {
-        let actualCorners = [];
+    // 只有当有选择角点时才计算实际坐标
+    const actualCorners = corners.length === 4 ? getActualCorners() : [];
 
-        // 只有当有选择角点时才计算实际坐标
-        if (corners.length === 4) {
-            const scaleX = img.naturalWidth / canvas.width;
-            const scaleY = img.naturalHeight / canvas.height;
+    showResultLoading(true);
+
+    try {
+        const response = await fetch(getApiUrl('/reprocess'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                filename: uploadedFilename,
+                corners: actualCorners,
+                color_mode: currentColorMode,
+                processing_option: processingOption,
+                processed_filename: processedFilename,
+                alpha_filename: savedState.alphaFilename // 传递Alpha通道文件名
+            })
+        });
 
-            actualCorners = corners.map(corner => [
-                corner[0] * scaleX,
-                corner[1] * scaleY
-            ]);
+        const result = await response.json();
+
+        if (result.superseded) {
+            // 已有更新的处理请求，忽略本次结果
+            return;
         }
 
-        showResultLoading(true);
+        if (result.success) {
+            currentProcessingOption = processingOption;
+            displayProcessedImage(result.image_data);
+        } else {
+            showError(result.error || '重新处理失败');
+        }
+    } catch (error) {
+        showError('重新处理失败: ' + error.message);
+    } finally {
+        showResultLoading(false);
+    }
+}
 
-        try {
-            const response = await fetch(getApiUrl('/reprocess'), {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    filename: uploadedFilename,
-                    corners: actualCorners,
-                    color_mode: currentColorMode,
-                    processing_option: processingOption,
-                    processed_filename: processedFilename,
-                    alpha_filename: savedState.alphaFilename // 传递Alpha通道文件名
-                })
-            });
+// 选项预览的显示名称
+const optionPreviewLabels = {
+    color: {
+        original: '原色彩',
+        adjusted: '自动调色',
+        enhanced: '暴力上色'
+    },
+    grayscale: {
+        minimal: '仅转换',
+        standard: '标准',
+        more: '较多细节',
+        most: '更多细节',
+        extreme: '暴力细节',
+        silhouette: '极简剪影'
+    }
+};
 
-            const result = await response.json();
+// 一次请求获取所有处理选项的缩略图
+async function loadOptionPreviews() {
+    const container = document.getElementById('option-previews');
+    const list = document.getElementById('option-previews-list');
+    if (!container || !list || !uploadedFilename) {
+        return;
+    }
 
-            if (result.success) {
-                currentProcessingOption = processingOption;
-                displayProcessedImage(result.image_data);
-            } else {
-                showError(result.error || '重新处理失败');
+    list.innerHTML = '';
+    container.classList.add('d-none');
+
+    try {
+        const response = await fetch(getApiUrl('/preview_options'), {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                filename: uploadedFilename,
+                corners: savedState.actualCorners,
+                alpha_filename: savedState.alphaFilename
+            })
+        });
+
+        const result = await response.json();
+        if (!result.success) {
+            // 预览失败不影响主流程
+            if (debugMode) {
+                console.log('选项预览失败:', result.error);
             }
-        } catch (error) {
-            showError('重新处理失败: ' + error.message);
-        } finally {
-            showResultLoading(false);
+            return;
         }
-    };
 
-    img.src = 'data:image/png;base64,' + window.originalImageBase64;
+        ['color', 'grayscale'].forEach(colorMode => {
+            Object.keys(optionPreviewLabels[colorMode]).forEach(option => {
+                const imageData = result.thumbnails[colorMode] && result.thumbnails[colorMode][option];
+                if (!imageData) {
+                    return;
+                }
+
+                const figure = document.createElement('figure');
+                figure.className = 'option-preview text-center mb-0';
+                figure.dataset.mode = colorMode;
+                figure.dataset.option = option;
+
+                const img = document.createElement('img');
+                img.src = 'data:image/png;base64,' + imageData;
+                img.alt = optionPreviewLabels[colorMode][option];
+
+                const caption = document.createElement('figcaption');
+                caption.className = 'small text-muted';
+                caption.textContent = (colorMode === 'color' ? '彩色·' : '黑白·') + optionPreviewLabels[colorMode][option];
+
+                figure.appendChild(img);
+                figure.appendChild(caption);
+                figure.addEventListener('click', () => selectPreviewOption(colorMode, option));
+                list.appendChild(figure);
+            });
+        });
+
+        updateOptionPreviewSelection();
+        container.classList.remove('d-none');
+    } catch (error) {
+        if (debugMode) {
+            console.log('选项预览失败:', error);
+        }
+    }
+}
+
+// 选中某个预览后，仅按原尺寸处理这一项
+function selectPreviewOption(colorMode, option) {
+    if (colorMode === currentColorMode && option === currentProcessingOption) {
+        return;
+    }
+
+    currentColorMode = colorMode;
+    setupProcessingOptions(colorMode);
+
+    const radioName = colorMode === 'color' ? 'colorProcessing' : 'grayscaleProcessing';
+    const radio = document.querySelector(`input[name="${radioName}"][value="${option}"]`);
+    if (radio) {
+        radio.checked = true;
+    }
+    updateGrayscaleDescription();
+    reprocessImage();
+}
+
+// 高亮当前选中的预览
+function updateOptionPreviewSelection() {
+    document.querySelectorAll('#option-previews-list .option-preview').forEach(figure => {
+        const active = figure.dataset.mode === currentColorMode &&
+            figure.dataset.option === currentProcessingOption;
+        figure.classList.toggle('active', active);
+    });
 }
 
 function displayProcessedImage(imageData) {
@@ -1216,6 +1809,9 @@ function displayProcessedImage(imageData) {
     // 重置纵横比滑条
     resetAspectRatioSlider();
 
+    // 同步预览高亮
+    updateOptionPreviewSelection();
+
     // 在微信环境下更新下载按钮
     if (isWechat()) {
         const downloadBtn = document.getElementById('download-btn');
@@ -1403,6 +1999,10 @@ function startOver() {
         delete window.originalImageBase64;
     }
 
+    // 清除选项预览
+    document.getElementById('option-previews').classList.add('d-none');
+    document.getElementById('option-previews-list').innerHTML = '';
+
     // 隐藏所有section，只显示upload section
     document.getElementById('selection-section').classList.add('d-none');
     document.getElementById('result-section').classList.add('d-none');
@@ -1461,6 +2061,15 @@ function showLoading(show) {
         spinner.classList.remove('d-none');
     } else {
         spinner.classList.add('d-none');
+        setLoadingMessage(null);
+    }
+}
+
+// 更新加载提示文字，传入 null 恢复默认提示
+function setLoadingMessage(message) {
+    const element = document.getElementById('loading-message');
+    if (element) {
+        element.textContent = message || '正在处理图片，请稍候...';
     }
 }
 
@@ -1534,7 +2143,7 @@ function backToStep2() {
     }
 
     // 恢复图片显示
-    displayImageForSelection(savedState.uploadedImage);
+    displayImageForSelection(savedState.uploadedImage, savedState.imageType);
 
     // 显示步骤2
     showSection('selection-section');
@@ -1593,6 +2202,11 @@ async function switchColorMode(targetMode) {
 
         const result = await response.json();
 
+        if (result.superseded) {
+            // 已有更新的处理请求，忽略本次结果
+            return;
+        }
+
         if (result.success) {
             processedFilename = result.processed_filename;
             displayProcessedImage(result.image_data);
@@ -0,0 +1,53 @@
+"""
+导入 app 的开销：图像处理栈必须延迟到第一次处理图像时才导入（见 imaging.py），
+`flask cleanup` 等命令和 worker 启动时只加载 Flask 相关模块
+
+用法: python -m pytest tests  或  python -m unittest discover tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 app 的耗时上限（秒），可通过环境变量调整以适应较慢的机器
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "1.0"))
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "pillow_heif")
+
+# 在新的解释器中计时，不受本进程已导入模块的影响
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+class ImportTimeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        cls.result = json.loads(output.strip().splitlines()[-1])
+
+    def test_image_stack_not_imported(self):
+        self.assertEqual(self.result["loaded"], [])
+
+    def test_import_within_budget(self):
+        self.assertLess(self.result["elapsed"], IMPORT_TIME_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()